@@ -4,16 +4,904 @@ Args: event with httpMethod, queryStringParameters for filtering
 Returns: HTTP response with analytics data
 '''
 
+import base64
+import csv
+import hashlib
+import io
 import json
 import os
-from typing import Dict, Any
+import time
+import zlib
+from typing import Dict, Any, Iterator, List, Tuple, Optional
+import numpy as np
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime, timedelta
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, cursor as TupleCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import PoolError
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+
+# Idle connections kept alive between warm invocations: (connection, released_at)
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'discarded': 0, 'in_use': 0}
+
+# Set by backend/batch so in-process sub-requests share one connection and transaction
+_batch_connection = None
+
+def _ping_connection(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
+    if _batch_connection is not None:
+        return _batch_connection
+    
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        stale = time.monotonic() - released_at > DB_POOL_CHECK_INTERVAL
+        if conn.closed or (stale and not _ping_connection(conn)):
+            _db_pool_stats['discarded'] += 1
+            conn.close()
+            continue
+        _db_pool_stats['hits'] += 1
+        _db_pool_stats['in_use'] += 1
+        return conn
+    
+    if _db_pool_stats['in_use'] >= DB_POOL_MAX_SIZE:
+        raise PoolError('connection pool exhausted')
+    
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    _db_pool_stats['misses'] += 1
+    _db_pool_stats['in_use'] += 1
+    return conn
+
+def release_db_connection(conn) -> None:
+    if conn is _batch_connection:
+        return
+    
+    _db_pool_stats['in_use'] -= 1
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN:
+        try:
+            conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if len(_db_pool) < DB_POOL_MAX_SIZE:
+                _db_pool.append((conn, time.monotonic()))
+                return
+        except psycopg2.Error:
+            pass
+    _db_pool_stats['discarded'] += 1
+    conn.close()
+
+def db_pool_header() -> str:
+    stats = dict(_db_pool_stats, idle=len(_db_pool))
+    return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+ETAG_TABLES = ('analytics', 'tracks', 'label_artists')
+
+def read_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> str:
+    '''Strong ETag from the change counters of every table a GET reads, plus its parameters'''
+    cur.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    stamp = [[row['table_name'], row['version']] for row in cur.fetchall()]
+    key = json.dumps([stamp, sorted(params.items())], default=str)
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def bump_table_versions(cur, tables: Tuple[str, ...]) -> None:
+    '''Invalidate ETags for changes the table_versions triggers do not see (rollup rebuilds, partition moves)'''
+    cur.execute(
+        """INSERT INTO table_versions (table_name, version)
+           SELECT unnest(%s::text[]), 1
+           ON CONFLICT (table_name) DO UPDATE SET
+             version = table_versions.version + 1,
+             updated_at = CURRENT_TIMESTAMP""",
+        (list(tables),)
+    )
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    candidates = [tag.strip() for tag in headers.get('if-none-match', '').split(',')]
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in candidates)
+
+def etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Expose-Headers': 'ETag'} if etag else {}
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **etag_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+INGEST_COLUMNS = ('track_id', 'date', 'streams', 'revenue', 'country', 'platform', 'age_group', 'gender')
+INGEST_CHUNK_SIZE = 1 << 20
+ANALYTICS_PARTITION_MONTHS_AHEAD = 3
+# Oldest month a report may still load into, counted back from the current one
+INGEST_MAX_AGE_MONTHS = int(os.environ.get('INGEST_MAX_AGE_MONTHS', '24'))
+
+TREND_DEFAULT_DAYS = 90
+TREND_MAX_DAYS = 730
+TREND_DEFAULT_WINDOW = 7
+TREND_DEFAULT_HORIZON = 30
+TREND_MAX_TRACK_IDS = 1000
+TREND_ANOMALY_Z = 3.0
+TREND_ANOMALY_BASELINE_DAYS = 28
+
+# Cube dimension -> SQL expression over analytics rows
+CUBE_DIMENSIONS = {
+    'day': 'a.date',
+    'week': "date_trunc('week', a.date)::date",
+    'month': "date_trunc('month', a.date)::date",
+    'country': 'a.country',
+    'platform': 'a.platform',
+    'age_group': 'a.age_group',
+    'gender': 'a.gender',
+}
+CUBE_DATE_DIMENSIONS = ('day', 'week', 'month')
+CUBE_FILTERS = ('country', 'platform', 'age_group', 'gender')
+CUBE_MAX_BREAKDOWNS = 16
+
+# Distributor fee taken off gross revenue before the label/artist split, as a fraction
+PAYOUT_PLATFORM_FEE = os.environ.get('PAYOUT_PLATFORM_FEE', '0')
+# Shares are DECIMAL(6, 5): multiplied by this they are exact integers
+PAYOUT_SHARE_SCALE = 100000
+PAYOUT_CHUNK_ROWS = 5000
+
+class ChunkReader:
+    '''File-like view over an iterator of byte chunks, as consumed by copy_expert'''
+    
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        # Consumed bytes are skipped by offset and only dropped when the next chunk is appended,
+        # so a line read costs its own length rather than a copy of the rest of the buffer
+        self.buffer = bytearray()
+        self.offset = 0
+        self.bytes_read = 0
+    
+    def _more(self) -> bool:
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.bytes_read += len(chunk)
+        del self.buffer[:self.offset]
+        self.offset = 0
+        self.buffer += chunk
+        return True
+    
+    def _take(self, end: int) -> bytes:
+        data = bytes(self.buffer[self.offset:end])
+        self.offset = end
+        return data
+    
+    def readline(self) -> bytes:
+        scanned = 0
+        while True:
+            end = self.buffer.find(b'\n', self.offset + scanned)
+            if end >= 0:
+                return self._take(end + 1)
+            scanned = len(self.buffer) - self.offset
+            if not self._more():
+                return self._take(len(self.buffer))
+    
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self.buffer) - self.offset < size) and self._more():
+            pass
+        end = len(self.buffer) if size < 0 else min(self.offset + size, len(self.buffer))
+        return self._take(end)
+
+def iter_well_formed_rows(reader: ChunkReader, delimiter: str, width: int, stats: Dict[str, int]) -> Iterator[bytes]:
+    '''Re-emit the report as comma-separated chunks, dropping (and counting) lines COPY would abort on.
+    
+    Report fields never span lines, so each line is parsed on its own: a stray quote costs only
+    that line, and lines without quotes skip the csv module entirely.
+    '''
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for raw in iter(reader.readline, b''):
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line:
+            continue
+        quoted = '"' in line
+        if quoted:
+            try:
+                row = next(csv.reader((line,), delimiter=delimiter, strict=True))
+            except csv.Error:
+                stats['malformed'] += 1
+                continue
+        else:
+            row = line.split(delimiter)
+        if len(row) != width or '\0' in line:
+            stats['malformed'] += 1
+            continue
+        if quoted or delimiter != ',':
+            writer.writerow(row)
+        else:
+            out.write(line + '\n')
+        if out.tell() >= INGEST_CHUNK_SIZE:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+def iter_body_chunks(event: Dict[str, Any], gzipped: bool) -> Iterator[bytes]:
+    '''Decode the request body slice by slice so no full decoded copy is ever held'''
+    body = event.get('body') or ''
+    is_base64 = event.get('isBase64Encoded', False)
+    step = INGEST_CHUNK_SIZE
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    
+    for offset in range(0, len(body), step):
+        piece = body[offset:offset + step]
+        data = base64.b64decode(piece) if is_base64 else piece.encode()
+        if not inflater:
+            if data:
+                yield data
+            continue
+        # Inflate at most one chunk at a time: a small compressed slice can expand enormously
+        while True:
+            inflated = inflater.decompress(data, INGEST_CHUNK_SIZE)
+            if inflated:
+                yield inflated
+            data = inflater.unconsumed_tail
+            if not data and len(inflated) < INGEST_CHUNK_SIZE:
+                break
+    
+    if inflater:
+        tail = inflater.flush()
+        if tail:
+            yield tail
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+class ExportSink:
+    '''COPY TO STDOUT target that keeps the output, gzip-compressing it chunk by chunk as it arrives'''
+    
+    def __init__(self, gzipped: bool):
+        self.parts: List[bytes] = []
+        self.size = 0
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzipped else None
+    
+    def write(self, data: Any) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self.size += len(data)
+        chunk = self.compressor.compress(data) if self.compressor else data
+        if chunk:
+            self.parts.append(chunk)
+        return len(data)
+    
+    def getvalue(self) -> bytes:
+        if self.compressor:
+            self.parts.append(self.compressor.flush())
+            self.compressor = None
+        return b''.join(self.parts)
+
+def export_response(conn, query: str, params_list: List[Any], params: Dict[str, Any], name: str, etag: Optional[str]) -> Dict[str, Any]:
+    '''Run a list query through COPY TO STDOUT as CSV or NDJSON, optionally gzipped, as a file download'''
+    export_format = params['export']
+    gzipped = params.get('compression') == 'gzip'
+    cur = conn.cursor()
+    select_sql = cur.mogrify(query, params_list).decode()
+    if export_format == 'csv':
+        copy_sql = f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    else:
+        # JSON text never contains the raw \x01/\x02 quote and delimiter bytes, so each row is copied verbatim
+        copy_sql = (
+            f"COPY (SELECT row_to_json(e)::text FROM ({select_sql}) e) "
+            "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        )
+    sink = ExportSink(gzipped)
+    cur.copy_expert(copy_sql, sink)
+    cur.close()
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"{name}.{extension}" + ('.gz' if gzipped else '')
+    body = sink.getvalue()
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/gzip' if gzipped else content_type,
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Access-Control-Allow-Origin': '*',
+            'X-Export-Bytes': str(sink.size),
+            'X-DB-Pool': db_pool_header(),
+            **etag_headers(etag)
+        },
+        'body': base64.b64encode(body).decode() if gzipped else body.decode(),
+        'isBase64Encoded': gzipped
+    }
+
+def date_range_filter(column: str, start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, List[Any]]:
+    '''Inclusive date bounds as literal predicates, so the planner can prune analytics partitions'''
+    sql = ''
+    values = []
+    if start_date:
+        sql += f" AND {column} >= %s::date"
+        values.append(start_date)
+    if end_date:
+        sql += f" AND {column} <= %s::date"
+        values.append(end_date)
+    return sql, values
+
+def maintain_analytics_partitions(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Create the next months' partitions and optionally detach (archive) expired ones'''
+    months_ahead = int(params.get('months_ahead') or ANALYTICS_PARTITION_MONTHS_AHEAD)
+    retain_months = params.get('retain_months')
+    cur = conn.cursor()
+    
+    cur.execute(
+        """SELECT ensure_analytics_partitions(
+             CURRENT_DATE, (CURRENT_DATE + make_interval(months => %s))::DATE
+           ) as created""",
+        (months_ahead,)
+    )
+    result = {'created': cur.fetchone()['created'], 'detached': []}
+    
+    if retain_months:
+        cur.execute(
+            """SELECT detach_analytics_partitions(
+                 (date_trunc('month', CURRENT_DATE) - make_interval(months => %s))::DATE
+               ) as partition""",
+            (int(retain_months),)
+        )
+        result['detached'] = [row['partition'] for row in cur.fetchall()]
+        if result['detached']:
+            # Detaching fires no statement triggers on analytics, but the rows are gone from it
+            bump_table_versions(cur, ('analytics',))
+    
+    conn.commit()
+    cur.close()
+    return result
+
+def ingest_analytics_report(conn, event: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''COPY a CSV/TSV report into a staging table and merge it into analytics'''
+    delimiter = '\t' if params.get('format') == 'tsv' else ','
+    reader = ChunkReader(iter_body_chunks(event, params.get('compression') == 'gzip'))
+    started = time.monotonic()
+    
+    header = reader.readline().decode('utf-8-sig').strip('\r\n')
+    columns = [name.strip().lower() for name in next(csv.reader([header], delimiter=delimiter), [])]
+    unknown = [name for name in columns if name not in INGEST_COLUMNS]
+    if unknown or len(set(columns)) != len(columns) or not {'track_id', 'date'} <= set(columns):
+        return {'error': f"Header must name track_id, date and any of {', '.join(INGEST_COLUMNS)} once each"}
+    
+    cur = conn.cursor()
+    cur.execute(
+        """CREATE TEMP TABLE analytics_staging (
+             line BIGSERIAL,
+             track_id TEXT, date TEXT, streams TEXT, revenue TEXT,
+             country TEXT, platform TEXT, age_group TEXT, gender TEXT
+           ) ON COMMIT DROP"""
+    )
+    # Lines with the wrong field count would make COPY abort the whole load, so they are
+    # filtered out here; everything else is staged as text and validated in the merge
+    stats = {'malformed': 0}
+    cur.copy_expert(
+        f"COPY analytics_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        ChunkReader(iter_well_formed_rows(reader, delimiter, len(columns), stats)),
+        size=INGEST_CHUNK_SIZE
+    )
+    loaded_at = time.monotonic()
+    
+    # Partitions are created only for months that actually occur, inside the accepted window and
+    # not already archived: a typo date must not create years of partitions, and an archived month
+    # would get a fresh empty partition whose rows the rollups count a second time
+    cur.execute(
+        """SELECT month,
+                  month >= date_trunc('month', CURRENT_DATE) - make_interval(months => %s)
+                  AND month <= date_trunc('month', CURRENT_DATE) + make_interval(months => %s)
+                  AND to_regclass('analytics_archive_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM')) IS NULL
+                  AS accepted
+           FROM (
+             SELECT DISTINCT date_trunc('month', parse_iso_date(date))::DATE AS month
+             FROM analytics_staging
+           ) s
+           WHERE month IS NOT NULL
+           ORDER BY month""",
+        (INGEST_MAX_AGE_MONTHS, ANALYTICS_PARTITION_MONTHS_AHEAD)
+    )
+    months = cur.fetchall()
+    accepted_months = [row['month'] for row in months if row['accepted']]
+    cur.execute(
+        "SELECT ensure_analytics_partitions(month, month) FROM unnest(%s::date[]) AS month",
+        (accepted_months,)
+    )
+    
+    cur.execute(
+        """WITH parsed AS MATERIALIZED (
+             SELECT line,
+               CASE WHEN track_id ~ '^\\s*\\d{1,9}\\s*$' THEN trim(track_id)::INTEGER END AS track_id,
+               parse_iso_date(date) AS date,
+               CASE WHEN coalesce(streams, '') ~ '^\\s*\\d{0,9}\\s*$'
+                    THEN coalesce(nullif(trim(streams), ''), '0')::INTEGER END AS streams,
+               CASE WHEN coalesce(revenue, '') ~ '^\\s*(-?\\d{1,8}(\\.\\d*)?)?\\s*$'
+                    THEN coalesce(nullif(trim(revenue), ''), '0')::DECIMAL(10, 2) END AS revenue,
+               CASE WHEN length(trim(country)) BETWEEN 1 AND 3 THEN upper(trim(country)) END AS country,
+               CASE WHEN length(coalesce(nullif(trim(platform), ''), %(platform)s)) <= 50
+                    THEN coalesce(nullif(trim(platform), ''), %(platform)s) END AS platform,
+               left(nullif(trim(age_group), ''), 20) AS age_group,
+               left(nullif(trim(gender), ''), 20) AS gender
+             FROM analytics_staging
+           ),
+           valid AS (
+             SELECT DISTINCT ON (p.track_id, p.date, p.country, p.platform) p.*
+             FROM parsed p
+             JOIN tracks t ON t.id = p.track_id
+             WHERE p.date IS NOT NULL AND p.streams IS NOT NULL AND p.revenue IS NOT NULL
+               AND p.country IS NOT NULL AND p.platform IS NOT NULL
+               AND date_trunc('month', p.date)::DATE = ANY(%(months)s::date[])
+             ORDER BY p.track_id, p.date, p.country, p.platform, p.line DESC
+           ),
+           merged AS (
+             INSERT INTO analytics (track_id, date, streams, revenue, country, platform, age_group, gender)
+             SELECT track_id, date, streams, revenue, country, platform, age_group, gender FROM valid
+             ON CONFLICT (track_id, date, country, platform) DO UPDATE SET
+               streams = EXCLUDED.streams,
+               revenue = EXCLUDED.revenue,
+               age_group = EXCLUDED.age_group,
+               gender = EXCLUDED.gender
+             WHERE (analytics.streams, analytics.revenue, analytics.age_group, analytics.gender)
+                   IS DISTINCT FROM (EXCLUDED.streams, EXCLUDED.revenue, EXCLUDED.age_group, EXCLUDED.gender)
+             RETURNING (xmax = 0) AS inserted
+           )
+           SELECT (SELECT COUNT(*) FROM parsed) as total_rows,
+                  (SELECT COUNT(*) FROM valid) as valid_rows,
+                  COUNT(*) FILTER (WHERE inserted) as inserted,
+                  COUNT(*) FILTER (WHERE NOT inserted) as updated
+           FROM merged""",
+        {'platform': params.get('platform'), 'months': accepted_months}
+    )
+    counts = dict(cur.fetchone())
+    conn.commit()
+    cur.close()
+    
+    elapsed = time.monotonic() - started
+    return {
+        'rows': counts['total_rows'] + stats['malformed'],
+        'inserted': counts['inserted'],
+        'updated': counts['updated'],
+        'unchanged': counts['valid_rows'] - counts['inserted'] - counts['updated'],
+        'rejected': counts['total_rows'] - counts['valid_rows'] + stats['malformed'],
+        'rejected_months': [row['month'].isoformat() for row in months if not row['accepted']],
+        'bytes': reader.bytes_read,
+        'copy_ms': round((loaded_at - started) * 1000),
+        'elapsed_ms': round(elapsed * 1000),
+        'rows_per_sec': round(counts['total_rows'] / elapsed) if elapsed > 0 else None
+    }
+
+def trailing_mean_std(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    '''Mean and std of the `window` days before each day (the day itself excluded), per row'''
+    zeros = np.zeros((values.shape[0], 1))
+    sums = np.concatenate([zeros, np.cumsum(values, axis=1)], axis=1)
+    squares = np.concatenate([zeros, np.cumsum(values ** 2, axis=1)], axis=1)
+    
+    ends = np.arange(values.shape[1])
+    starts = np.maximum(ends - window, 0)
+    counts = (ends - starts).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[:, ends] - sums[:, starts]) / counts
+        variance = (squares[:, ends] - squares[:, starts]) / counts - mean ** 2
+    return mean, np.sqrt(np.clip(variance, 0, None))
+
+def trend_metrics(streams: np.ndarray, revenue: np.ndarray, window: int, horizon: int) -> Dict[str, np.ndarray]:
+    '''Vectorized trend metrics for a (series x days) matrix; every result has one entry per series'''
+    days = streams.shape[1]
+    
+    moving_streams = streams[:, -window:].mean(axis=1)
+    moving_revenue = revenue[:, -window:].mean(axis=1)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if days >= 14:
+            this_week = streams[:, -7:].sum(axis=1)
+            last_week = streams[:, -14:-7].sum(axis=1)
+            wow_growth = np.where(last_week > 0, (this_week - last_week) / last_week, np.nan)
+        else:
+            wow_growth = np.full(streams.shape[0], np.nan)
+        
+        mean, std = trailing_mean_std(streams, max(window, TREND_ANOMALY_BASELINE_DAYS))
+        z_scores = np.where(std > 0, (streams - mean) / std, 0.0)
+        anomalies = np.abs(np.nan_to_num(z_scores)) > TREND_ANOMALY_Z
+        # Too little history to judge the first days
+        anomalies[:, :max(window, TREND_ANOMALY_BASELINE_DAYS // 2)] = False
+    
+    # Least-squares line through daily revenue, solved for all series at once
+    x = np.arange(days, dtype=float)
+    x_centered = x - x.mean()
+    denominator = float((x_centered ** 2).sum()) or 1.0
+    revenue_mean = revenue.mean(axis=1)
+    slope = (revenue - revenue_mean[:, None]) @ x_centered / denominator
+    intercept = revenue_mean - slope * x.mean()
+    future = np.arange(days, days + horizon, dtype=float)
+    projected = np.clip(intercept[:, None] + slope[:, None] * future, 0, None).sum(axis=1)
+    
+    return {
+        'moving_avg_streams': moving_streams,
+        'moving_avg_revenue': moving_revenue,
+        'wow_growth': wow_growth,
+        'revenue_slope': slope,
+        'projected_revenue': projected,
+        'anomalies': anomalies,
+    }
+
+def _float_or_none(value: float, digits: int) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+def compute_trends(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Trend, anomaly and forecast report for a set of tracks, a user's catalog or a label's catalog'''
+    try:
+        days = min(int(params.get('days') or TREND_DEFAULT_DAYS), TREND_MAX_DAYS)
+        window = max(1, int(params.get('window') or TREND_DEFAULT_WINDOW))
+        horizon = max(1, int(params.get('horizon') or TREND_DEFAULT_HORIZON))
+        end = datetime.strptime(params['end_date'], '%Y-%m-%d').date() if params.get('end_date') else datetime.utcnow().date()
+        start = datetime.strptime(params['start_date'], '%Y-%m-%d').date() if params.get('start_date') else end - timedelta(days=days - 1)
+    except ValueError:
+        return {'error': 'Invalid trend parameters'}
+    
+    days = (end - start).days + 1
+    if days < 1 or days > TREND_MAX_DAYS:
+        return {'error': f'Date range must cover 1..{TREND_MAX_DAYS} days'}
+    window = min(window, days)
+    
+    try:
+        if params.get('track_ids'):
+            track_ids = [int(v) for v in params['track_ids'].split(',') if v.strip()][:TREND_MAX_TRACK_IDS]
+            scope_sql, scope_values = "a.track_id = ANY(%s)", [track_ids]
+        elif params.get('track_id'):
+            scope_sql, scope_values = "a.track_id = %s", [int(params['track_id'])]
+        elif params.get('user_id'):
+            scope_sql, scope_values = "t.user_id = %s", [int(params['user_id'])]
+        elif params.get('label_id'):
+            scope_sql = "t.user_id IN (SELECT user_id FROM label_artists WHERE label_id = %s)"
+            scope_values = [int(params['label_id'])]
+        else:
+            return {'error': 'track_ids, track_id, user_id or label_id is required'}
+    except ValueError:
+        return {'error': 'Invalid track_ids, track_id, user_id or label_id'}
+    
+    cur = conn.cursor(cursor_factory=TupleCursor)
+    cur.execute(
+        f"""SELECT a.track_id, a.date - %s::date, a.streams, a.revenue::float8
+           FROM analytics_daily_track a
+           JOIN tracks t ON t.id = a.track_id
+           WHERE {scope_sql} AND a.date BETWEEN %s::date AND %s::date""",
+        [start] + scope_values + [start, end]
+    )
+    rows = np.array(cur.fetchall(), dtype=float).reshape(-1, 4)
+    cur.close()
+    
+    track_keys, track_index = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+    day_index = rows[:, 1].astype(np.int64)
+    streams = np.zeros((len(track_keys), days))
+    revenue = np.zeros((len(track_keys), days))
+    np.add.at(streams, (track_index, day_index), rows[:, 2])
+    np.add.at(revenue, (track_index, day_index), rows[:, 3])
+    
+    # Row 0 is the whole selection, rows 1.. are the individual tracks
+    metrics = trend_metrics(
+        np.vstack([streams.sum(axis=0, keepdims=True), streams]),
+        np.vstack([revenue.sum(axis=0, keepdims=True), revenue]),
+        window, horizon
+    )
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+    
+    def describe(i: int) -> Dict[str, Any]:
+        return {
+            'moving_avg_streams': round(float(metrics['moving_avg_streams'][i]), 2),
+            'moving_avg_revenue': round(float(metrics['moving_avg_revenue'][i]), 2),
+            'wow_growth': _float_or_none(metrics['wow_growth'][i], 4),
+            'revenue_slope': round(float(metrics['revenue_slope'][i]), 4),
+            'projected_revenue': round(float(metrics['projected_revenue'][i]), 2),
+            'anomalies': [dates[d] for d in np.flatnonzero(metrics['anomalies'][i])],
+        }
+    
+    summary = describe(0)
+    if params.get('include_series') in ('1', 'true'):
+        summary['series'] = {
+            'dates': dates,
+            'streams': streams.sum(axis=0).astype(np.int64).tolist(),
+            'revenue': np.round(revenue.sum(axis=0), 2).tolist(),
+        }
+    
+    return {
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'window': window,
+        'horizon': horizon,
+        'summary': summary,
+        'tracks': [dict(track_id=int(track_id), **describe(i + 1)) for i, track_id in enumerate(track_keys)],
+    }
+
+def parse_cube_breakdowns(value: str) -> Optional[List[Tuple[str, ...]]]:
+    '''"country,month+platform" -> [('country',), ('month', 'platform')]; None if anything is unknown'''
+    breakdowns = []
+    for item in value.split(','):
+        dims = tuple(d.strip() for d in item.split('+') if d.strip())
+        if not dims or any(d not in CUBE_DIMENSIONS for d in dims):
+            return None
+        if not any(set(dims) == set(seen) for seen in breakdowns):
+            breakdowns.append(dims)
+    return breakdowns if 0 < len(breakdowns) <= CUBE_MAX_BREAKDOWNS else None
+
+def analytics_cube(cur, breakdowns: List[Tuple[str, ...]], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''All requested breakdowns plus the grand total from one scan of analytics via GROUPING SETS'''
+    columns = []
+    for dims in breakdowns:
+        columns.extend(d for d in dims if d not in columns)
+    
+    where = ''
+    values: List[Any] = []
+    joins = ''
+    if params.get('track_id'):
+        where += " AND a.track_id = %s"
+        values.append(int(params['track_id']))
+    if params.get('user_id'):
+        joins = " JOIN tracks t ON t.id = a.track_id"
+        where += " AND t.user_id = %s"
+        values.append(int(params['user_id']))
+    if params.get('label_id'):
+        joins = " JOIN tracks t ON t.id = a.track_id"
+        where += " AND t.user_id IN (SELECT user_id FROM label_artists WHERE label_id = %s)"
+        values.append(int(params['label_id']))
+    for name in CUBE_FILTERS:
+        if params.get(name):
+            where += f" AND a.{name} = %s"
+            values.append(params[name])
+    range_sql, range_values = date_range_filter('a.date', params.get('start_date'), params.get('end_date'))
+    where += range_sql
+    values += range_values
+    
+    expressions = [CUBE_DIMENSIONS[d] for d in columns]
+    grouping_sets = ', '.join(
+        '(' + ', '.join(CUBE_DIMENSIONS[d] for d in dims) + ')' for dims in breakdowns
+    )
+    select_dims = ''.join(f"{expr} AS {name}, " for name, expr in zip(columns, expressions))
+    cur.execute(
+        f"""SELECT {select_dims}GROUPING({', '.join(expressions)}) AS grouping_id,
+                  SUM(a.streams) AS streams, SUM(a.revenue) AS revenue
+           FROM analytics a{joins}
+           WHERE 1=1{where}
+           GROUP BY GROUPING SETS ({grouping_sets}, ())
+           ORDER BY streams DESC""",
+        values
+    )
+    
+    # GROUPING() sets the bit of every column that is rolled up, first column = highest bit
+    all_bits = (1 << len(columns)) - 1
+    keys = {}
+    for dims in breakdowns:
+        mask = all_bits
+        for d in dims:
+            mask &= ~(1 << (len(columns) - 1 - columns.index(d)))
+        keys[mask] = dims
+    
+    result = {'breakdowns': {'+'.join(dims): [] for dims in breakdowns}, 'totals': {'streams': 0, 'revenue': 0}}
+    for row in cur.fetchall():
+        if row['grouping_id'] == all_bits:
+            result['totals'] = {'streams': row['streams'] or 0, 'revenue': row['revenue'] or 0}
+            continue
+        dims = keys[row['grouping_id']]
+        entry = {d: row[d] for d in dims}
+        entry['streams'] = row['streams']
+        entry['revenue'] = row['revenue']
+        result['breakdowns']['+'.join(dims)].append(entry)
+    
+    for dims in breakdowns:
+        date_dims = [d for d in dims if d in CUBE_DATE_DIMENSIONS]
+        if date_dims:
+            result['breakdowns']['+'.join(dims)].sort(key=lambda entry: entry[date_dims[0]])
+    return result
+
+def parse_payout_period(params: Dict[str, Any]) -> Optional[Tuple[date, date]]:
+    '''period=YYYY-MM (whole month) or start_date/end_date'''
+    try:
+        if params.get('period'):
+            first = datetime.strptime(params['period'], '%Y-%m').date()
+            last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+            return first, last
+        if params.get('start_date') and params.get('end_date'):
+            first = datetime.strptime(params['start_date'], '%Y-%m-%d').date()
+            last = datetime.strptime(params['end_date'], '%Y-%m-%d').date()
+            return (first, last) if first <= last else None
+    except ValueError:
+        pass
+    return None
+
+def apply_share(cents: np.ndarray, share_units: Any) -> np.ndarray:
+    '''cents * share / PAYOUT_SHARE_SCALE rounded half up, in exact integer arithmetic'''
+    return (cents * share_units + PAYOUT_SHARE_SCALE // 2) // PAYOUT_SHARE_SCALE
+
+def cents_to_decimal(cents: Any) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+def compute_payouts(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Recompute the payout statements of a period from analytics, replacing any earlier run'''
+    period = parse_payout_period(params)
+    if period is None:
+        return {'error': 'period=YYYY-MM or start_date and end_date are required'}
+    try:
+        fee_units = int(Decimal(PAYOUT_PLATFORM_FEE) * PAYOUT_SHARE_SCALE)
+    except InvalidOperation:
+        fee_units = -1
+    if not 0 <= fee_units <= PAYOUT_SHARE_SCALE:
+        return {'error': 'PAYOUT_PLATFORM_FEE must be a fraction between 0 and 1'}
+    started = time.monotonic()
+    
+    cur = conn.cursor()
+    # One run at a time; a re-run of the same period replaces its lines in the same transaction
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('payout_statements'))")
+    
+    # A month whose partition was detached (archived) or never created has no facts here:
+    # recomputing would replace its statements with empty or partial ones, so keep them instead
+    cur.execute(
+        """SELECT to_char(m, '"analytics_y"YYYY"m"MM') as partition
+           FROM generate_series(date_trunc('month', %s::date), %s::date, INTERVAL '1 month') m
+           WHERE to_char(m, '"analytics_y"YYYY"m"MM') NOT IN (
+             SELECT c.relname
+             FROM pg_inherits i
+             JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = 'analytics'::regclass
+           )
+           ORDER BY m""",
+        period
+    )
+    missing = [row['partition'] for row in cur.fetchall()]
+    if missing:
+        conn.rollback()
+        cur.close()
+        return {
+            'error': 'Analytics partitions for this period are missing or archived; existing statements are kept',
+            'missing_partitions': missing
+        }
+    
+    cur.execute("DELETE FROM payout_statements WHERE period_start = %s AND period_end = %s", period)
+    
+    # Artists reach their label through their earliest label_artists membership
+    facts = conn.cursor(name='payout_facts', cursor_factory=TupleCursor)
+    facts.execute(
+        """WITH gross AS (
+             SELECT t.user_id, SUM(a.streams)::BIGINT AS streams, SUM(a.revenue) AS revenue
+             FROM analytics a
+             JOIN tracks t ON t.id = a.track_id
+             WHERE a.date >= %s AND a.date <= %s AND t.user_id IS NOT NULL
+             GROUP BY t.user_id
+           ),
+           membership AS (
+             SELECT DISTINCT ON (user_id) user_id, label_id
+             FROM label_artists
+             WHERE label_id IS NOT NULL
+             ORDER BY user_id, joined_at, id
+           )
+           SELECT g.user_id, g.streams, (g.revenue * 100)::BIGINT AS gross_cents,
+                  COALESCE(m.label_id, 0) AS label_id,
+                  (COALESCE(artist_rule.label_share, label_rule.label_share, 0) * %s)::BIGINT AS label_share_units
+           FROM gross g
+           LEFT JOIN membership m ON m.user_id = g.user_id
+           LEFT JOIN royalty_split_rules artist_rule ON artist_rule.label_id = m.label_id AND artist_rule.user_id = g.user_id
+           LEFT JOIN royalty_split_rules label_rule ON label_rule.label_id = m.label_id AND label_rule.user_id IS NULL
+           ORDER BY g.user_id""",
+        (period[0], period[1], PAYOUT_SHARE_SCALE)
+    )
+    
+    totals = {'artists': 0, 'lines': 0, 'streams': 0, 'gross_cents': 0, 'fee_cents': 0, 'label_cents': 0, 'artist_cents': 0}
+    fee_share = Decimal(fee_units).scaleb(-5)
+    while True:
+        chunk = facts.fetchmany(PAYOUT_CHUNK_ROWS)
+        if not chunk:
+            break
+        user_ids, streams, gross, label_ids, share_units = np.array(chunk, dtype=np.int64).T
+        
+        fee = apply_share(gross, fee_units)
+        net = gross - fee
+        label_cut = np.where(label_ids > 0, apply_share(net, share_units), 0)
+        # The artist takes the remainder, so every line set sums back to gross exactly
+        artist_cut = net - label_cut
+        
+        lines = []
+        for i in range(len(chunk)):
+            label_id = int(label_ids[i]) or None
+            artist_share = Decimal(PAYOUT_SHARE_SCALE - int(share_units[i]) if label_id else PAYOUT_SHARE_SCALE).scaleb(-5)
+            lines.append((
+                'user', int(user_ids[i]), int(user_ids[i]), label_id, int(streams[i]),
+                cents_to_decimal(gross[i]), cents_to_decimal(fee[i]), artist_share, cents_to_decimal(artist_cut[i]),
+                period[0], period[1]
+            ))
+            if label_id and share_units[i] > 0:
+                lines.append((
+                    'label', label_id, int(user_ids[i]), label_id, int(streams[i]),
+                    cents_to_decimal(gross[i]), cents_to_decimal(fee[i]), Decimal(int(share_units[i])).scaleb(-5),
+                    cents_to_decimal(label_cut[i]), period[0], period[1]
+                ))
+        
+        execute_values(
+            cur,
+            """INSERT INTO payout_statements
+                 (payee_type, payee_id, source_user_id, label_id, streams,
+                  gross_revenue, platform_fee, share, amount, period_start, period_end)
+               VALUES %s""",
+            lines,
+            page_size=1000
+        )
+        
+        totals['artists'] += len(chunk)
+        totals['lines'] += len(lines)
+        totals['streams'] += int(streams.sum())
+        totals['gross_cents'] += int(gross.sum())
+        totals['fee_cents'] += int(fee.sum())
+        totals['label_cents'] += int(label_cut.sum())
+        totals['artist_cents'] += int(artist_cut.sum())
+    facts.close()
+    
+    if params.get('dry_run') in ('1', 'true'):
+        conn.rollback()
+    else:
+        conn.commit()
+    cur.close()
+    
+    return {
+        'period_start': period[0].isoformat(),
+        'period_end': period[1].isoformat(),
+        'platform_fee_share': fee_share,
+        'artists': totals['artists'],
+        'lines': totals['lines'],
+        'streams': totals['streams'],
+        'gross_revenue': cents_to_decimal(totals['gross_cents']),
+        'platform_fee': cents_to_decimal(totals['fee_cents']),
+        'label_amount': cents_to_decimal(totals['label_cents']),
+        'artist_amount': cents_to_decimal(totals['artist_cents']),
+        'dry_run': params.get('dry_run') in ('1', 'true'),
+        'elapsed_ms': round((time.monotonic() - started) * 1000),
+    }
+
+def list_payout_statements(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Statement lines and totals of a period for one artist (user_id) or one label (label_id)'''
+    period = parse_payout_period(params)
+    if period is None:
+        return {'error': 'period=YYYY-MM or start_date and end_date are required'}
+    if params.get('label_id'):
+        payee = ('label', int(params['label_id']))
+    elif params.get('user_id'):
+        payee = ('user', int(params['user_id']))
+    else:
+        return {'error': 'user_id or label_id is required'}
+    
+    cur.execute(
+        """SELECT s.source_user_id, u.username, u.full_name, s.label_id, s.streams,
+                  s.gross_revenue, s.platform_fee, s.share, s.amount, s.computed_at
+           FROM payout_statements s
+           JOIN users u ON u.id = s.source_user_id
+           WHERE s.period_start = %s AND s.period_end = %s AND s.payee_type = %s AND s.payee_id = %s
+           ORDER BY s.amount DESC, s.source_user_id""",
+        (period[0], period[1], payee[0], payee[1])
+    )
+    lines = [dict(row) for row in cur.fetchall()]
+    return {
+        'period_start': period[0].isoformat(),
+        'period_end': period[1].isoformat(),
+        'payee_type': payee[0],
+        'payee_id': payee[1],
+        'lines': lines,
+        'totals': {
+            'streams': sum(line['streams'] for line in lines),
+            'gross_revenue': sum((line['gross_revenue'] for line in lines), Decimal('0.00')),
+            'amount': sum((line['amount'] for line in lines), Decimal('0.00')),
+        },
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -24,14 +912,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
-    if method != 'GET':
+    if method not in ('GET', 'POST'):
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -39,6 +927,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    conn = None
+    etag = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -48,100 +938,162 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user_id = params.get('user_id')
         start_date = params.get('start_date')
         end_date = params.get('end_date')
+        action = params.get('action')
+        range_sql, range_values = date_range_filter('date', start_date, end_date)
+        daily_limit = '' if range_sql else ' LIMIT 30'
         
         result = {}
         
-        if track_id:
+        if method == 'GET':
+            tables = ETAG_TABLES + ('payout_statements',) if params.get('view') == 'statements' else ETAG_TABLES
+            etag = read_etag(cur, tables, params)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+        
+        if method == 'POST':
+            if action == 'rebuild_rollups':
+                started = time.monotonic()
+                cur.execute("SELECT rebuild_analytics_rollups()")
+                # Dashboard ETags are keyed on analytics, which the rebuild itself does not write
+                bump_table_versions(cur, ('analytics',))
+                conn.commit()
+                result = {'rebuilt': True, 'elapsed_ms': round((time.monotonic() - started) * 1000)}
+            elif action == 'ingest':
+                result = ingest_analytics_report(conn, event, params)
+            elif action == 'maintain_partitions':
+                result = maintain_analytics_partitions(conn, params)
+            elif action == 'compute_payouts':
+                result = compute_payouts(conn, params)
+            else:
+                result = {'error': 'Unknown action'}
+        
+        elif params.get('export') in EXPORT_FORMATS:
+            export_range_sql, export_values = date_range_filter('a.date', start_date, end_date)
+            query = f"""SELECT a.track_id, t.title, t.artist, t.user_id, a.date, a.country, a.platform,
+                              a.age_group, a.gender, a.streams, a.revenue
+                       FROM analytics a
+                       JOIN tracks t ON t.id = a.track_id
+                       WHERE 1=1{export_range_sql}"""
+            if track_id:
+                query += " AND a.track_id = %s"
+                export_values.append(int(track_id))
+            if user_id:
+                query += " AND t.user_id = %s"
+                export_values.append(int(user_id))
+            if params.get('label_id'):
+                query += " AND t.user_id IN (SELECT user_id FROM label_artists WHERE label_id = %s)"
+                export_values.append(int(params['label_id']))
+            return export_response(conn, query, export_values, params, 'analytics', etag)
+        
+        elif params.get('export'):
+            result = {'error': f"export must be one of {', '.join(EXPORT_FORMATS)}"}
+        
+        elif params.get('view') == 'trends':
+            result = compute_trends(conn, params)
+        
+        elif params.get('view') == 'statements':
+            result = list_payout_statements(cur, params)
+        
+        elif params.get('view') == 'cube':
+            breakdowns = parse_cube_breakdowns(params.get('dimensions') or '')
+            if breakdowns is None:
+                result = {'error': f"dimensions must be up to {CUBE_MAX_BREAKDOWNS} of {', '.join(CUBE_DIMENSIONS)}, combined with '+'"}
+            else:
+                result = analytics_cube(cur, breakdowns, params)
+        
+        elif track_id:
             cur.execute(
-                """SELECT date, SUM(streams) as streams, SUM(revenue) as revenue
-                   FROM analytics 
-                   WHERE track_id = %s
-                   GROUP BY date
-                   ORDER BY date DESC
-                   LIMIT 30""",
-                (int(track_id),)
+                f"""SELECT date, streams, revenue
+                   FROM analytics_daily_track
+                   WHERE track_id = %s{range_sql}
+                   ORDER BY date DESC{daily_limit}""",
+                [int(track_id)] + range_values
             )
             result['daily'] = [dict(row) for row in cur.fetchall()]
             
-            cur.execute(
-                """SELECT country, SUM(streams) as streams
-                   FROM analytics 
-                   WHERE track_id = %s
-                   GROUP BY country
-                   ORDER BY streams DESC
-                   LIMIT 10""",
-                (int(track_id),)
+            cube = analytics_cube(
+                cur, [('country',), ('platform',)],
+                {'track_id': track_id, 'start_date': start_date, 'end_date': end_date}
             )
-            result['countries'] = [dict(row) for row in cur.fetchall()]
-            
-            cur.execute(
-                """SELECT platform, SUM(streams) as streams, SUM(revenue) as revenue
-                   FROM analytics 
-                   WHERE track_id = %s
-                   GROUP BY platform
-                   ORDER BY streams DESC""",
-                (int(track_id),)
-            )
-            result['platforms'] = [dict(row) for row in cur.fetchall()]
+            result['countries'] = [
+                {'country': row['country'], 'streams': row['streams']} for row in cube['breakdowns']['country'][:10]
+            ]
+            result['platforms'] = cube['breakdowns']['platform']
         
         elif user_id:
             cur.execute(
-                """SELECT a.date, SUM(a.streams) as streams, SUM(a.revenue) as revenue
-                   FROM analytics a
-                   JOIN tracks t ON a.track_id = t.id
-                   WHERE t.user_id = %s
-                   GROUP BY a.date
-                   ORDER BY a.date DESC
-                   LIMIT 30""",
-                (int(user_id),)
+                f"""SELECT date, streams, revenue
+                   FROM analytics_daily_user
+                   WHERE user_id = %s{range_sql}
+                   ORDER BY date DESC{daily_limit}""",
+                [int(user_id)] + range_values
             )
             result['daily'] = [dict(row) for row in cur.fetchall()]
             
-            cur.execute(
-                """SELECT t.id, t.title, t.artist, SUM(a.streams) as total_streams, SUM(a.revenue) as total_revenue
-                   FROM tracks t
-                   JOIN analytics a ON t.id = a.track_id
-                   WHERE t.user_id = %s
-                   GROUP BY t.id, t.title, t.artist
-                   ORDER BY total_revenue DESC
-                   LIMIT 10""",
-                (int(user_id),)
-            )
+            if range_sql:
+                cur.execute(
+                    f"""SELECT t.id, t.title, t.artist, SUM(a.streams) as total_streams, SUM(a.revenue) as total_revenue
+                       FROM analytics_daily_track a
+                       JOIN tracks t ON t.id = a.track_id
+                       WHERE t.user_id = %s{range_sql}
+                       GROUP BY t.id, t.title, t.artist
+                       ORDER BY total_revenue DESC
+                       LIMIT 10""",
+                    [int(user_id)] + range_values
+                )
+            else:
+                cur.execute(
+                    """SELECT t.id, t.title, t.artist, a.streams as total_streams, a.revenue as total_revenue
+                       FROM analytics_total_track a
+                       JOIN tracks t ON t.id = a.track_id
+                       WHERE a.user_id = %s
+                       ORDER BY a.revenue DESC
+                       LIMIT 10""",
+                    (int(user_id),)
+                )
             result['top_tracks'] = [dict(row) for row in cur.fetchall()]
             
-            cur.execute(
-                """SELECT SUM(streams) as total_streams, SUM(revenue) as total_revenue
-                   FROM analytics a
-                   JOIN tracks t ON a.track_id = t.id
-                   WHERE t.user_id = %s""",
-                (int(user_id),)
-            )
+            if range_sql:
+                cur.execute(
+                    f"""SELECT SUM(streams) as total_streams, SUM(revenue) as total_revenue
+                       FROM analytics_daily_user
+                       WHERE user_id = %s{range_sql}""",
+                    [int(user_id)] + range_values
+                )
+            else:
+                cur.execute(
+                    """SELECT streams as total_streams, revenue as total_revenue
+                       FROM analytics_total_user
+                       WHERE user_id = %s""",
+                    (int(user_id),)
+                )
             totals = cur.fetchone()
             result['totals'] = dict(totals) if totals else {'total_streams': 0, 'total_revenue': 0}
         
         else:
             cur.execute(
-                """SELECT date, SUM(streams) as streams, SUM(revenue) as revenue
-                   FROM analytics
-                   GROUP BY date
-                   ORDER BY date DESC
-                   LIMIT 30"""
+                f"""SELECT date, streams, revenue
+                   FROM analytics_daily_platform
+                   WHERE 1=1{range_sql}
+                   ORDER BY date DESC{daily_limit}""",
+                range_values
             )
             result['daily'] = [dict(row) for row in cur.fetchall()]
             
             cur.execute(
-                """SELECT SUM(streams) as total_streams, SUM(revenue) as total_revenue
-                   FROM analytics"""
+                f"""SELECT SUM(streams) as total_streams, SUM(revenue) as total_revenue
+                   FROM analytics_daily_platform
+                   WHERE 1=1{range_sql}""",
+                range_values
             )
             totals = cur.fetchone()
             result['totals'] = dict(totals) if totals else {'total_streams': 0, 'total_revenue': 0}
         
         cur.close()
-        conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-DB-Pool': db_pool_header(), **etag_headers(etag)},
             'body': json.dumps(result, default=str),
             'isBase64Encoded': False
         }
@@ -153,3 +1105,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
@@ -4,16 +4,400 @@ Args: event with httpMethod, body, queryStringParameters
 Returns: HTTP response with tracks data
 '''
 
+import base64
+import hashlib
 import json
 import os
-from typing import Dict, Any, List, Optional
+import re
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
 from datetime import datetime
 
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+
+# Idle connections kept alive between warm invocations: (connection, released_at)
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'discarded': 0, 'in_use': 0}
+
+# Set by backend/batch so in-process sub-requests share one connection and transaction
+_batch_connection = None
+
+def _ping_connection(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 def get_db_connection():
+    if _batch_connection is not None:
+        return _batch_connection
+    
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        stale = time.monotonic() - released_at > DB_POOL_CHECK_INTERVAL
+        if conn.closed or (stale and not _ping_connection(conn)):
+            _db_pool_stats['discarded'] += 1
+            conn.close()
+            continue
+        _db_pool_stats['hits'] += 1
+        _db_pool_stats['in_use'] += 1
+        return conn
+    
+    if _db_pool_stats['in_use'] >= DB_POOL_MAX_SIZE:
+        raise PoolError('connection pool exhausted')
+    
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    _db_pool_stats['misses'] += 1
+    _db_pool_stats['in_use'] += 1
+    return conn
+
+def release_db_connection(conn) -> None:
+    if conn is _batch_connection:
+        return
+    
+    _db_pool_stats['in_use'] -= 1
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN:
+        try:
+            conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if len(_db_pool) < DB_POOL_MAX_SIZE:
+                _db_pool.append((conn, time.monotonic()))
+                return
+        except psycopg2.Error:
+            pass
+    _db_pool_stats['discarded'] += 1
+    conn.close()
+
+def db_pool_header() -> str:
+    stats = dict(_db_pool_stats, idle=len(_db_pool))
+    return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+ETAG_TABLES = ('tracks', 'users')
+
+def read_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> str:
+    '''Strong ETag from the change counters of every table a GET reads, plus its parameters'''
+    cur.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    stamp = [[row['table_name'], row['version']] for row in cur.fetchall()]
+    key = json.dumps([stamp, sorted(params.items())], default=str)
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    candidates = [tag.strip() for tag in headers.get('if-none-match', '').split(',')]
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in candidates)
+
+def etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Expose-Headers': 'ETag'} if etag else {}
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **etag_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+TRACK_SORT_COLUMNS = ('upload_date', 'created_at', 'updated_at', 'title', 'artist', 'streams', 'revenue')
+TRACK_PAGE_DEFAULT_LIMIT = 50
+TRACK_PAGE_MAX_LIMIT = 500
+
+def encode_cursor(sort_by: str, order: str, row: Dict[str, Any]) -> str:
+    value = row[sort_by]
+    payload = [sort_by, order, value.isoformat() if isinstance(value, datetime) else value, row['id']]
+    raw = json.dumps(payload, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str) -> Optional[List[Any]]:
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_by, order, value, last_id = json.loads(raw)
+        return [sort_by, order, value, int(last_id)]
+    except (ValueError, TypeError):
+        return None
+
+TRACK_SEARCH_DEFAULT_LIMIT = 20
+TRACK_SEARCH_MAX_LIMIT = 100
+
+def build_prefix_tsquery(text: str) -> str:
+    terms = re.findall(r'\w+', text.lower())
+    return ' & '.join(f"{term}:*" for term in terms)
+
+STREAM_BATCH_SIZE = 1000
+
+class RawJSON(str):
+    '''Response body that is already JSON-encoded and must be sent as is'''
+
+def stream_json_rows(conn, query: str, params_list: List[Any]) -> RawJSON:
+    '''Encode a list query batch by batch from a server-side cursor'''
+    chunks = []
+    with conn.cursor(name='stream_json_rows') as cur:
+        cur.itersize = STREAM_BATCH_SIZE
+        cur.execute(query, params_list)
+        while True:
+            rows = cur.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            chunks.append(json.dumps(rows, default=str)[1:-1])
+    return RawJSON('[' + ', '.join(chunks) + ']')
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+class ExportSink:
+    '''COPY TO STDOUT target that keeps the output, gzip-compressing it chunk by chunk as it arrives'''
+    
+    def __init__(self, gzipped: bool):
+        self.parts: List[bytes] = []
+        self.size = 0
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzipped else None
+    
+    def write(self, data: Any) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self.size += len(data)
+        chunk = self.compressor.compress(data) if self.compressor else data
+        if chunk:
+            self.parts.append(chunk)
+        return len(data)
+    
+    def getvalue(self) -> bytes:
+        if self.compressor:
+            self.parts.append(self.compressor.flush())
+            self.compressor = None
+        return b''.join(self.parts)
+
+def export_response(conn, query: str, params_list: List[Any], params: Dict[str, Any], name: str, etag: Optional[str]) -> Dict[str, Any]:
+    '''Run a list query through COPY TO STDOUT as CSV or NDJSON, optionally gzipped, as a file download'''
+    export_format = params['export']
+    gzipped = params.get('compression') == 'gzip'
+    cur = conn.cursor()
+    select_sql = cur.mogrify(query, params_list).decode()
+    if export_format == 'csv':
+        copy_sql = f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    else:
+        # JSON text never contains the raw \x01/\x02 quote and delimiter bytes, so each row is copied verbatim
+        copy_sql = (
+            f"COPY (SELECT row_to_json(e)::text FROM ({select_sql}) e) "
+            "TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+        )
+    sink = ExportSink(gzipped)
+    cur.copy_expert(copy_sql, sink)
+    cur.close()
+    
+    content_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"{name}.{extension}" + ('.gz' if gzipped else '')
+    body = sink.getvalue()
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/gzip' if gzipped else content_type,
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Access-Control-Allow-Origin': '*',
+            'X-Export-Bytes': str(sink.size),
+            'X-DB-Pool': db_pool_header(),
+            **etag_headers(etag)
+        },
+        'body': base64.b64encode(body).decode() if gzipped else body.decode(),
+        'isBase64Encoded': gzipped
+    }
+
+NON_ASCII_RE = re.compile(r'[^\x00-\x7e]')
+
+# Row-rendering SQL per list query text, built once per warm instance
+_json_render_queries: Dict[str, str] = {}
+
+def _render_column_sql(name: str, type_code: int) -> str:
+    column = f'q."{name}"'
+    if type_code in (16, 20, 21, 23, 26, 700, 701):
+        value = f"{column}::text"
+    elif type_code == 1700:
+        value = f"to_json({column}::text)::text"
+    elif type_code == 1082:
+        value = f"to_json(to_char({column}, 'YYYY-MM-DD'))::text"
+    elif type_code in (1114, 1184):
+        value = (
+            f"to_json(to_char({column}, 'YYYY-MM-DD HH24:MI:SS')"
+            f" || CASE WHEN to_char({column}, 'US') <> '000000' THEN to_char({column}, '.US') ELSE '' END"
+            + (f" || to_char({column}, 'TZH:TZM')" if type_code == 1184 else '')
+            + ")::text"
+        )
+    elif type_code in (114, 3802):
+        value = f"{column}::jsonb::text"
+    else:
+        value = f"to_json({column})::text"
+    return f"'{json.dumps(name)}: ' || coalesce({value}, 'null')"
+
+def render_json_rows(conn, query: str, params_list: List[Any]) -> RawJSON:
+    '''Let Postgres render every row formatted exactly like json.dumps(dict(row), default=str)'''
+    render_query = _json_render_queries.get(query)
+    with conn.cursor(cursor_factory=TupleCursor) as cur:
+        if render_query is None:
+            cur.execute(f"SELECT * FROM ({query}) q LIMIT 0", params_list)
+            row_sql = " || ', ' || ".join(_render_column_sql(column.name, column.type_code) for column in cur.description)
+            render_query = f"SELECT '{{' || {row_sql} || '}}' FROM ({query}) q"
+            _json_render_queries[query] = render_query
+        cur.execute(render_query, params_list)
+        body = '[' + ', '.join(row[0] for row in cur) + ']'
+    if not body.isascii():
+        body = NON_ASCII_RE.sub(lambda match: json.dumps(match.group())[1:-1], body)
+    return RawJSON(body)
+
+TRACK_UPDATE_FIELDS = ('title', 'artist', 'genre', 'bpm', 'key', 'mood', 'status', 'rejection_reason', 'streams', 'revenue')
+BULK_FILTER_FIELDS = ('status', 'genre', 'user_id')
+BULK_BATCH_SIZE = 1000
+
+def bulk_update_tracks(conn, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Apply one set of field changes to many tracks: one UPDATE and one commit per batch.
+    
+    Targets are either explicit ids or a filter such as {"status": "pending", "genre": "House"};
+    filter batches walk the matching rows by id so every batch is a short index range.
+    '''
+    changes = body_data.get('set') or {}
+    fields = [field for field in TRACK_UPDATE_FIELDS if field in changes]
+    if not fields:
+        return {'error': 'No fields to update'}
+    
+    assignments = ', '.join(f"{field} = %s" for field in fields) + ", updated_at = CURRENT_TIMESTAMP"
+    values = [changes[field] for field in fields]
+    cur = conn.cursor()
+    results = []
+    
+    if 'ids' in body_data:
+        ids = list(dict.fromkeys(int(track_id) for track_id in body_data['ids']))
+        for start in range(0, len(ids), BULK_BATCH_SIZE):
+            batch = ids[start:start + BULK_BATCH_SIZE]
+            cur.execute(
+                f"UPDATE tracks SET {assignments} WHERE id = ANY(%s) RETURNING id",
+                values + [batch]
+            )
+            updated = {row['id'] for row in cur.fetchall()}
+            conn.commit()
+            results.extend({'id': track_id, 'status': 'updated' if track_id in updated else 'not_found'} for track_id in batch)
+    else:
+        track_filter = body_data.get('filter') or {}
+        criteria = [field for field in BULK_FILTER_FIELDS if track_filter.get(field) is not None]
+        if not criteria:
+            return {'error': f"filter needs at least one of {', '.join(BULK_FILTER_FIELDS)}"}
+        
+        where = ' AND '.join(f"{field} = %s" for field in criteria)
+        where_values = [track_filter[field] for field in criteria]
+        last_id = 0
+        while True:
+            cur.execute(
+                f"""UPDATE tracks SET {assignments}
+                    WHERE id IN (
+                      SELECT id FROM tracks
+                      WHERE {where} AND id > %s
+                      ORDER BY id
+                      LIMIT %s
+                      FOR UPDATE
+                    )
+                    RETURNING id""",
+                values + where_values + [last_id, BULK_BATCH_SIZE]
+            )
+            updated = sorted(row['id'] for row in cur.fetchall())
+            conn.commit()
+            if not updated:
+                break
+            results.extend({'id': track_id, 'status': 'updated'} for track_id in updated)
+            last_id = updated[-1]
+    
+    cur.close()
+    return {
+        'updated': sum(1 for item in results if item['status'] == 'updated'),
+        'not_found': sum(1 for item in results if item['status'] == 'not_found'),
+        'results': results
+    }
+
+MODERATION_LEASE_SECONDS = int(os.environ.get('MODERATION_LEASE_SECONDS', '300'))
+MODERATION_MAX_CLAIM = 50
+
+def moderation_queue(conn, action: str, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Claim, heartbeat or release leases on pending tracks.
+    
+    Claiming locks candidate rows with FOR UPDATE SKIP LOCKED, so concurrent claimers never wait on
+    or return the same track; an expired lease is simply claimable again.
+    '''
+    moderator_id = int(body_data['moderator_id'])
+    lease_seconds = int(body_data.get('lease_seconds') or MODERATION_LEASE_SECONDS)
+    cur = conn.cursor()
+    
+    if action == 'claim':
+        limit = max(1, min(int(body_data.get('limit') or 1), MODERATION_MAX_CLAIM))
+        cur.execute(
+            """WITH candidates AS (
+                 SELECT t.id
+                 FROM tracks t
+                 LEFT JOIN moderation_claims c ON c.track_id = t.id
+                 WHERE t.status = 'pending'
+                   AND (c.track_id IS NULL OR c.expires_at < CURRENT_TIMESTAMP)
+                 ORDER BY t.upload_date, t.id
+                 LIMIT %s
+                 FOR UPDATE OF t SKIP LOCKED
+               ),
+               claimed AS (
+                 INSERT INTO moderation_claims (track_id, moderator_id, claimed_at, expires_at)
+                 SELECT id, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP + make_interval(secs => %s)
+                 FROM candidates
+                 ON CONFLICT (track_id) DO UPDATE SET
+                   moderator_id = EXCLUDED.moderator_id,
+                   claimed_at = EXCLUDED.claimed_at,
+                   expires_at = EXCLUDED.expires_at
+                 WHERE moderation_claims.expires_at < CURRENT_TIMESTAMP
+                 RETURNING track_id, expires_at
+               )
+               SELECT t.*, c.expires_at as claim_expires_at
+               FROM claimed c
+               JOIN tracks t ON t.id = c.track_id
+               ORDER BY t.upload_date, t.id""",
+            (limit, moderator_id, lease_seconds)
+        )
+        result = {'claimed': [dict(row) for row in cur.fetchall()]}
+    
+    elif action == 'heartbeat':
+        track_ids = [int(track_id) for track_id in body_data.get('track_ids') or []]
+        cur.execute(
+            """UPDATE moderation_claims
+               SET expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+               WHERE track_id = ANY(%s) AND moderator_id = %s AND expires_at >= CURRENT_TIMESTAMP
+               RETURNING track_id, expires_at""",
+            (lease_seconds, track_ids, moderator_id)
+        )
+        extended = {row['track_id']: row['expires_at'] for row in cur.fetchall()}
+        result = {
+            'extended': [{'track_id': track_id, 'expires_at': expires_at} for track_id, expires_at in extended.items()],
+            'lost': [track_id for track_id in track_ids if track_id not in extended]
+        }
+    
+    else:
+        track_ids = [int(track_id) for track_id in body_data.get('track_ids') or []]
+        cur.execute(
+            """DELETE FROM moderation_claims
+               WHERE moderator_id = %s AND (track_id = ANY(%s) OR %s OR expires_at < CURRENT_TIMESTAMP)
+               RETURNING track_id""",
+            (moderator_id, track_ids, bool(body_data.get('all')))
+        )
+        result = {'released': [row['track_id'] for row in cur.fetchall()]}
+    
+    conn.commit()
+    cur.close()
+    return result
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -24,26 +408,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    conn = None
+    etag = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         
+        params = event.get('queryStringParameters') or {}
+        
         if method == 'GET':
-            params = event.get('queryStringParameters') or {}
+            etag = read_etag(cur, ETAG_TABLES, params)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+            
             track_id = params.get('id')
             user_id = params.get('user_id')
             status = params.get('status')
             genre = params.get('genre')
             search = params.get('search')
+            q = params.get('q')
             sort_by = params.get('sort_by', 'upload_date')
-            order = params.get('order', 'DESC')
+            order = params.get('order', 'DESC').upper()
+            limit = params.get('limit')
+            cursor = params.get('cursor')
+            cursor_values = decode_cursor(cursor) if cursor else None
             
             if track_id:
                 cur.execute(
@@ -52,6 +447,51 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 track = cur.fetchone()
                 result = dict(track) if track else None
+            elif q is not None:
+                tsquery = build_prefix_tsquery(q)
+                filters = ""
+                filter_params = []
+                
+                if user_id:
+                    filters += " AND t.user_id = %s"
+                    filter_params.append(int(user_id))
+                
+                if status:
+                    filters += " AND t.status = %s"
+                    filter_params.append(status)
+                
+                if genre:
+                    filters += " AND t.genre = %s"
+                    filter_params.append(genre)
+                
+                if tsquery:
+                    page_size = max(1, min(int(limit or TRACK_SEARCH_DEFAULT_LIMIT), TRACK_SEARCH_MAX_LIMIT))
+                    cur.execute(
+                        f"""SELECT t.*, u.username, u.full_name, s.rank,
+                           ts_headline('simple', t.title || ' - ' || t.artist, s.query,
+                                       'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') as headline
+                           FROM (
+                             SELECT t.id, q.query,
+                                    ts_rank(track_search_document(t.title, t.artist), q.query)
+                                      + greatest(similarity(t.title, %s), similarity(t.artist, %s)) as rank
+                             FROM tracks t, to_tsquery('simple', %s) q(query)
+                             WHERE (track_search_document(t.title, t.artist) @@ q.query
+                                    OR t.title %% %s OR t.artist %% %s){filters}
+                             ORDER BY rank DESC, t.id DESC
+                             LIMIT %s
+                           ) s
+                           JOIN tracks t ON t.id = s.id
+                           LEFT JOIN users u ON t.user_id = u.id
+                           ORDER BY s.rank DESC, t.id DESC""",
+                        [q, q, tsquery, q, q] + filter_params + [page_size]
+                    )
+                    result = {'items': [dict(track) for track in cur.fetchall()]}
+                else:
+                    result = {'items': []}
+            elif sort_by not in TRACK_SORT_COLUMNS or order not in ('ASC', 'DESC'):
+                result = {'error': f"sort_by must be one of {', '.join(TRACK_SORT_COLUMNS)} and order ASC or DESC"}
+            elif cursor and (cursor_values is None or cursor_values[:2] != [sort_by, order]):
+                result = {'error': 'Invalid cursor for this sort_by/order'}
             else:
                 query = "SELECT t.*, u.username, u.full_name FROM tracks t LEFT JOIN users u ON t.user_id = u.id WHERE 1=1"
                 params_list = []
@@ -73,14 +513,46 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     search_param = f"%{search}%"
                     params_list.extend([search_param, search_param])
                 
-                query += f" ORDER BY t.{sort_by} {order}"
+                if cursor_values:
+                    last_value, last_id = cursor_values[2:]
+                    comparison = '<' if order == 'DESC' else '>'
+                    query += f" AND (t.{sort_by}, t.id) {comparison} (%s, %s)"
+                    params_list.extend([last_value, last_id])
                 
-                cur.execute(query, params_list)
-                tracks = cur.fetchall()
-                result = [dict(track) for track in tracks]
+                query += f" ORDER BY t.{sort_by} {order}, t.id {order}"
+                
+                if params.get('export') in EXPORT_FORMATS:
+                    return export_response(conn, query, params_list, params, 'tracks', etag)
+                elif params.get('export'):
+                    result = {'error': f"export must be one of {', '.join(EXPORT_FORMATS)}"}
+                elif limit or cursor:
+                    page_size = max(1, min(int(limit or TRACK_PAGE_DEFAULT_LIMIT), TRACK_PAGE_MAX_LIMIT))
+                    query += " LIMIT %s"
+                    params_list.append(page_size + 1)
+                    
+                    cur.execute(query, params_list)
+                    tracks = [dict(track) for track in cur.fetchall()]
+                    has_more = len(tracks) > page_size
+                    tracks = tracks[:page_size]
+                    result = {
+                        'items': tracks,
+                        'next_cursor': encode_cursor(sort_by, order, tracks[-1]) if has_more else None
+                    }
+                elif params.get('render') == 'db':
+                    result = render_json_rows(conn, query, params_list)
+                elif params.get('stream'):
+                    result = stream_json_rows(conn, query, params_list)
+                else:
+                    cur.execute(query, params_list)
+                    tracks = cur.fetchall()
+                    result = [dict(track) for track in tracks]
+        
+        elif method == 'POST' and params.get('action') in ('claim', 'heartbeat', 'release'):
+            body_data = json.loads(event.get('body') or '{}')
+            result = moderation_queue(conn, params['action'], body_data)
         
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             
             cur.execute(
                 """INSERT INTO tracks 
@@ -106,14 +578,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             track = cur.fetchone()
             result = dict(track)
         
+        elif method == 'PUT' and params.get('bulk'):
+            body_data = json.loads(event.get('body') or '{}')
+            result = bulk_update_tracks(conn, body_data)
+        
         elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             track_id = body_data.get('id')
             
             update_fields = []
             params_list = []
             
-            for field in ['title', 'artist', 'genre', 'bpm', 'key', 'mood', 'status', 'rejection_reason', 'streams', 'revenue']:
+            for field in TRACK_UPDATE_FIELDS:
                 if field in body_data:
                     update_fields.append(f"{field} = %s")
                     params_list.append(body_data[field])
@@ -131,7 +607,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 result = {'error': 'No fields to update'}
         
         elif method == 'DELETE':
-            params = event.get('queryStringParameters') or {}
             track_id = params.get('id')
             
             cur.execute("UPDATE tracks SET status = 'rejected' WHERE id = %s RETURNING *", (int(track_id),))
@@ -142,7 +617,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         else:
             result = {'error': 'Method not allowed'}
             cur.close()
-            conn.close()
             return {
                 'statusCode': 405,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -151,12 +625,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         cur.close()
-        conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(result, default=str),
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-DB-Pool': db_pool_header(), **etag_headers(etag)},
+            'body': result if isinstance(result, RawJSON) else json.dumps(result, default=str),
             'isBase64Encoded': False
         }
     
@@ -167,3 +640,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
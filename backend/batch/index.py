@@ -0,0 +1,242 @@
+'''
+Business: Batch API - run many sub-requests to api, analytics, users, social, labels in one invocation on one connection
+Args: event with httpMethod, body {"requests": [{"id", "function", "event"}], "snapshot": bool}
+Returns: HTTP response with per-item status, headers and body in request order
+'''
+
+import importlib.util
+import json
+import os
+import time
+from typing import Dict, Any, List, Tuple
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
+
+BATCH_FUNCTIONS = ('api', 'analytics', 'users', 'social', 'labels')
+BATCH_FUNCTIONS_DIR = os.environ.get(
+    'BATCH_FUNCTIONS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+)
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '50'))
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+
+# Idle connections kept alive between warm invocations: (connection, released_at)
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'discarded': 0, 'in_use': 0}
+
+def _ping_connection(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_db_connection():
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        stale = time.monotonic() - released_at > DB_POOL_CHECK_INTERVAL
+        if conn.closed or (stale and not _ping_connection(conn)):
+            _db_pool_stats['discarded'] += 1
+            conn.close()
+            continue
+        _db_pool_stats['hits'] += 1
+        _db_pool_stats['in_use'] += 1
+        return conn
+    
+    if _db_pool_stats['in_use'] >= DB_POOL_MAX_SIZE:
+        raise PoolError('connection pool exhausted')
+    
+    dsn = os.environ.get('DATABASE_URL')
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    _db_pool_stats['misses'] += 1
+    _db_pool_stats['in_use'] += 1
+    return conn
+
+def release_db_connection(conn) -> None:
+    _db_pool_stats['in_use'] -= 1
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN:
+        try:
+            conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if len(_db_pool) < DB_POOL_MAX_SIZE:
+                _db_pool.append((conn, time.monotonic()))
+                return
+        except psycopg2.Error:
+            pass
+    _db_pool_stats['discarded'] += 1
+    conn.close()
+
+def db_pool_header() -> str:
+    stats = dict(_db_pool_stats, idle=len(_db_pool))
+    return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+# Handler modules of the other functions, loaded once per warm instance
+_function_modules: Dict[str, Any] = {}
+
+def function_path(name: str) -> str:
+    return os.path.join(BATCH_FUNCTIONS_DIR, name, 'index.py')
+
+def missing_functions(names) -> List[str]:
+    '''Functions whose handler was not deployed next to this one (each function is built separately)'''
+    return sorted(
+        name for name in set(names)
+        if name not in _function_modules and not os.path.isfile(function_path(name))
+    )
+
+def load_function(name: str):
+    module = _function_modules.get(name)
+    if module is None:
+        path = function_path(name)
+        spec = importlib.util.spec_from_file_location(f'batch_{name}_index', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _function_modules[name] = module
+    return module
+
+def dispatch(conn, item: Dict[str, Any], snapshot: bool) -> Dict[str, Any]:
+    '''Run one sub-request in-process with the batch connection swapped in for the handler's pool.
+    
+    Outside a snapshot, whatever a sub-request left uncommitted is rolled back before the next one,
+    exactly as releasing a pooled connection would; inside it only a failed transaction is.
+    '''
+    module = load_function(item['function'])
+    module._batch_connection = conn
+    try:
+        response = module.handler(item.get('event') or {}, None)
+    finally:
+        module._batch_connection = None
+    
+    status = conn.get_transaction_status()
+    if status == TRANSACTION_STATUS_INERROR or (not snapshot and status != TRANSACTION_STATUS_IDLE):
+        conn.rollback()
+    return response
+
+def encode_item(item_id: Any, response: Dict[str, Any]) -> str:
+    '''Splice the sub-response body in as is instead of decoding and re-encoding it'''
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if not body:
+        body = 'null'
+    elif not headers.get('Content-Type', '').startswith('application/json') or response.get('isBase64Encoded'):
+        body = json.dumps(body)
+    return (
+        '{"id": ' + json.dumps(item_id) +
+        ', "status": ' + json.dumps(response.get('statusCode', 500)) +
+        ', "headers": ' + json.dumps(headers) +
+        ', "body": ' + body + '}'
+    )
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    body_data = json.loads(event.get('body') or '{}')
+    if not isinstance(body_data, dict) or not isinstance(body_data.get('requests') or [], list):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Body must be an object with a requests array'}),
+            'isBase64Encoded': False
+        }
+    requests = body_data.get('requests') or []
+    
+    invalid = [
+        index for index, item in enumerate(requests)
+        if not isinstance(item, dict) or item.get('function') not in BATCH_FUNCTIONS
+        or not isinstance(item.get('event') or {}, dict)
+    ]
+    if invalid or len(requests) > BATCH_MAX_REQUESTS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'error': f"Up to {BATCH_MAX_REQUESTS} requests, each with function one of {', '.join(BATCH_FUNCTIONS)} and an object event",
+                'invalid': invalid
+            }),
+            'isBase64Encoded': False
+        }
+    
+    missing = missing_functions(item['function'] for item in requests)
+    if missing:
+        return {
+            'statusCode': 501,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'error': f"Functions not available in this deployment: {', '.join(missing)}",
+                'missing': missing
+            }),
+            'isBase64Encoded': False
+        }
+    
+    read_only = all((item.get('event') or {}).get('httpMethod', 'GET') == 'GET' for item in requests)
+    snapshot = read_only and body_data.get('snapshot', True)
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        if snapshot:
+            conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        
+        started = time.monotonic()
+        items = []
+        for index, item in enumerate(requests):
+            response = dispatch(conn, item, snapshot)
+            items.append(encode_item(item.get('id', index), response))
+        elapsed_ms = round((time.monotonic() - started) * 1000)
+        
+        body = (
+            '{"snapshot": ' + json.dumps(snapshot) +
+            ', "elapsed_ms": ' + json.dumps(elapsed_ms) +
+            ', "results": [' + ', '.join(items) + ']}'
+        )
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-DB-Pool': db_pool_header()},
+            'body': body,
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    finally:
+        if conn is not None:
+            if snapshot and not conn.closed:
+                try:
+                    conn.rollback()
+                    conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+                except psycopg2.Error:
+                    conn.close()
+            release_db_connection(conn)
@@ -4,15 +4,338 @@ Args: event with httpMethod, body, queryStringParameters
 Returns: HTTP response with labels and releases data
 '''
 
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import re
+import time
+from typing import Dict, Any, List, Tuple, Optional
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+
+# Idle connections kept alive between warm invocations: (connection, released_at)
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'discarded': 0, 'in_use': 0}
+
+# Set by backend/batch so in-process sub-requests share one connection and transaction
+_batch_connection = None
+
+def _ping_connection(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
+    if _batch_connection is not None:
+        return _batch_connection
+    
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        stale = time.monotonic() - released_at > DB_POOL_CHECK_INTERVAL
+        if conn.closed or (stale and not _ping_connection(conn)):
+            _db_pool_stats['discarded'] += 1
+            conn.close()
+            continue
+        _db_pool_stats['hits'] += 1
+        _db_pool_stats['in_use'] += 1
+        return conn
+    
+    if _db_pool_stats['in_use'] >= DB_POOL_MAX_SIZE:
+        raise PoolError('connection pool exhausted')
+    
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    _db_pool_stats['misses'] += 1
+    _db_pool_stats['in_use'] += 1
+    return conn
+
+def release_db_connection(conn) -> None:
+    if conn is _batch_connection:
+        return
+    
+    _db_pool_stats['in_use'] -= 1
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN:
+        try:
+            conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if len(_db_pool) < DB_POOL_MAX_SIZE:
+                _db_pool.append((conn, time.monotonic()))
+                return
+        except psycopg2.Error:
+            pass
+    _db_pool_stats['discarded'] += 1
+    conn.close()
+
+def db_pool_header() -> str:
+    stats = dict(_db_pool_stats, idle=len(_db_pool))
+    return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+ETAG_TABLES = {
+    'labels': ('labels', 'label_artists', 'users'),
+    'releases': ('releases', 'tracks', 'users'),
+    'performance': ('labels', 'label_artists', 'users', 'tracks', 'analytics'),
+    'split_rules': ('royalty_split_rules',),
+}
+
+def read_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> str:
+    '''Strong ETag from the change counters of every table a GET reads, plus its parameters'''
+    cur.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    stamp = [[row['table_name'], row['version']] for row in cur.fetchall()]
+    key = json.dumps([stamp, sorted(params.items())], default=str)
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    candidates = [tag.strip() for tag in headers.get('if-none-match', '').split(',')]
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in candidates)
+
+def etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Expose-Headers': 'ETag'} if etag else {}
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **etag_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+STREAM_BATCH_SIZE = 1000
+
+class RawJSON(str):
+    '''Response body that is already JSON-encoded and must be sent as is'''
+
+def stream_json_rows(conn, query: str, params_list: List[Any]) -> RawJSON:
+    '''Encode a list query batch by batch from a server-side cursor'''
+    chunks = []
+    with conn.cursor(name='stream_json_rows') as cur:
+        cur.itersize = STREAM_BATCH_SIZE
+        cur.execute(query, params_list)
+        while True:
+            rows = cur.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            chunks.append(json.dumps(rows, default=str)[1:-1])
+    return RawJSON('[' + ', '.join(chunks) + ']')
+
+NON_ASCII_RE = re.compile(r'[^\x00-\x7e]')
+
+# Row-rendering SQL per list query text, built once per warm instance
+_json_render_queries: Dict[str, str] = {}
+
+def _render_column_sql(name: str, type_code: int) -> str:
+    column = f'q."{name}"'
+    if type_code in (16, 20, 21, 23, 26, 700, 701):
+        value = f"{column}::text"
+    elif type_code == 1700:
+        value = f"to_json({column}::text)::text"
+    elif type_code == 1082:
+        value = f"to_json(to_char({column}, 'YYYY-MM-DD'))::text"
+    elif type_code in (1114, 1184):
+        value = (
+            f"to_json(to_char({column}, 'YYYY-MM-DD HH24:MI:SS')"
+            f" || CASE WHEN to_char({column}, 'US') <> '000000' THEN to_char({column}, '.US') ELSE '' END"
+            + (f" || to_char({column}, 'TZH:TZM')" if type_code == 1184 else '')
+            + ")::text"
+        )
+    elif type_code in (114, 3802):
+        value = f"{column}::jsonb::text"
+    else:
+        value = f"to_json({column})::text"
+    return f"'{json.dumps(name)}: ' || coalesce({value}, 'null')"
+
+def render_json_rows(conn, query: str, params_list: List[Any]) -> RawJSON:
+    '''Let Postgres render every row formatted exactly like json.dumps(dict(row), default=str)'''
+    render_query = _json_render_queries.get(query)
+    with conn.cursor(cursor_factory=TupleCursor) as cur:
+        if render_query is None:
+            cur.execute(f"SELECT * FROM ({query}) q LIMIT 0", params_list)
+            row_sql = " || ', ' || ".join(_render_column_sql(column.name, column.type_code) for column in cur.description)
+            render_query = f"SELECT '{{' || {row_sql} || '}}' FROM ({query}) q"
+            _json_render_queries[query] = render_query
+        cur.execute(render_query, params_list)
+        body = '[' + ', '.join(row[0] for row in cur) + ']'
+    if not body.isascii():
+        body = NON_ASCII_RE.sub(lambda match: json.dumps(match.group())[1:-1], body)
+    return RawJSON(body)
+
+LABEL_TOP_TRACKS_DEFAULT = 10
+LABEL_TOP_TRACKS_MAX = 100
+
+def label_performance(cur, params: Dict[str, Any]) -> Any:
+    '''Streams/revenue per label, or for one label per roster artist plus top tracks, from the analytics rollups'''
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    range_sql = ''
+    range_values: List[Any] = []
+    if start_date:
+        range_sql += " AND d.date >= %s::date"
+        range_values.append(start_date)
+    if end_date:
+        range_sql += " AND d.date <= %s::date"
+        range_values.append(end_date)
+    
+    # All-time figures come straight from analytics_total_*; a period sums the daily rollups
+    if range_sql:
+        artist_totals = f"""LEFT JOIN LATERAL (
+                              SELECT SUM(d.streams) as streams, SUM(d.revenue) as revenue
+                              FROM analytics_daily_user d
+                              WHERE d.user_id = la.user_id{range_sql}
+                            ) a ON true"""
+        artist_values = range_values
+    else:
+        artist_totals = "LEFT JOIN analytics_total_user a ON a.user_id = la.user_id"
+        artist_values = []
+    
+    label_id = params.get('label_id')
+    if not label_id:
+        query = f"""SELECT l.id, l.name, l.logo_url, COUNT(la.user_id) as artist_count,
+                           COALESCE(SUM(a.streams), 0) as streams, COALESCE(SUM(a.revenue), 0) as revenue
+                    FROM labels l
+                    LEFT JOIN label_artists la ON l.id = la.label_id
+                    {artist_totals}"""
+        values = list(artist_values)
+        if params.get('user_id'):
+            query += " WHERE l.owner_id = %s OR l.id IN (SELECT label_id FROM label_artists WHERE user_id = %s)"
+            values += [int(params['user_id']), int(params['user_id'])]
+        cur.execute(query + " GROUP BY l.id ORDER BY revenue DESC", values)
+        return [dict(row) for row in cur.fetchall()]
+    
+    cur.execute(
+        f"""SELECT u.id as user_id, u.username, u.full_name, u.avatar_url, la.role,
+                  COALESCE(a.streams, 0) as streams, COALESCE(a.revenue, 0) as revenue
+           FROM label_artists la
+           JOIN users u ON la.user_id = u.id
+           {artist_totals}
+           WHERE la.label_id = %s
+           ORDER BY revenue DESC, u.id""",
+        artist_values + [int(label_id)]
+    )
+    artists = [dict(row) for row in cur.fetchall()]
+    
+    top = max(1, min(int(params.get('top') or LABEL_TOP_TRACKS_DEFAULT), LABEL_TOP_TRACKS_MAX))
+    if range_sql:
+        cur.execute(
+            f"""SELECT t.id, t.title, t.artist, t.user_id, SUM(d.streams) as streams, SUM(d.revenue) as revenue
+               FROM analytics_daily_track d
+               JOIN tracks t ON d.track_id = t.id
+               WHERE t.user_id IN (SELECT user_id FROM label_artists WHERE label_id = %s){range_sql}
+               GROUP BY t.id, t.title, t.artist, t.user_id
+               ORDER BY revenue DESC
+               LIMIT %s""",
+            [int(label_id)] + range_values + [top]
+        )
+    else:
+        cur.execute(
+            """SELECT t.id, t.title, t.artist, t.user_id, a.streams, a.revenue
+               FROM analytics_total_track a
+               JOIN tracks t ON a.track_id = t.id
+               WHERE a.user_id IN (SELECT user_id FROM label_artists WHERE label_id = %s)
+               ORDER BY a.revenue DESC
+               LIMIT %s""",
+            (int(label_id), top)
+        )
+    
+    return {
+        'label_id': int(label_id),
+        'totals': {
+            'artist_count': len(artists),
+            'streams': sum(artist['streams'] for artist in artists),
+            'revenue': sum(artist['revenue'] for artist in artists),
+        },
+        'artists': artists,
+        'top_tracks': [dict(row) for row in cur.fetchall()],
+    }
+
+RELEASE_PUBLISH_BATCH_SIZE = 500
+RELEASE_PUBLISH_TIME_BUDGET = 20.0
+
+def publish_due_releases(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Publish every due scheduled release and its track, notifying the artist and their label owners'''
+    batch_size = max(1, min(int(params.get('batch_size') or RELEASE_PUBLISH_BATCH_SIZE), 5000))
+    started = time.monotonic()
+    totals = {'releases': 0, 'tracks': 0, 'notifications': 0, 'batches': 0}
+    cur = conn.cursor()
+    
+    # Each batch claims rows with SKIP LOCKED and does release, track and notifications in one
+    # statement, so concurrent runs split the work and a re-run finds nothing left to do.
+    # Releases whose track has not passed moderation stay scheduled until it is approved.
+    while time.monotonic() - started < RELEASE_PUBLISH_TIME_BUDGET:
+        cur.execute(
+            """WITH due AS (
+                 SELECT r.id
+                 FROM releases r
+                 JOIN tracks t ON r.track_id = t.id
+                 WHERE r.status = 'scheduled' AND r.release_date <= CURRENT_DATE
+                   AND t.status IN ('approved', 'published')
+                 ORDER BY r.release_date, r.id
+                 LIMIT %s
+                 FOR UPDATE OF r SKIP LOCKED
+               ),
+               released AS (
+                 UPDATE releases r SET status = 'published', updated_at = CURRENT_TIMESTAMP
+                 FROM due
+                 WHERE r.id = due.id
+                 RETURNING r.id, r.track_id, r.user_id
+               ),
+               published_tracks AS (
+                 UPDATE tracks t SET status = 'published',
+                                     publish_date = COALESCE(t.publish_date, CURRENT_TIMESTAMP),
+                                     updated_at = CURRENT_TIMESTAMP
+                 FROM released
+                 WHERE t.id = released.track_id AND t.status = 'approved'
+                 RETURNING t.id
+               ),
+               audience AS (
+                 SELECT released.user_id, released.track_id FROM released
+                 UNION
+                 SELECT l.owner_id, released.track_id
+                 FROM released
+                 JOIN label_artists la ON la.user_id = released.user_id
+                 JOIN labels l ON l.id = la.label_id
+                 WHERE l.owner_id IS NOT NULL
+               ),
+               notified AS (
+                 INSERT INTO notifications (user_id, type, title, message, link)
+                 SELECT audience.user_id, 'success', 'Релиз опубликован',
+                        t.artist || ' - ' || t.title || ' вышел на площадках', NULL
+                 FROM audience
+                 JOIN tracks t ON t.id = audience.track_id
+                 WHERE audience.user_id IS NOT NULL
+                 RETURNING id
+               )
+               SELECT (SELECT COUNT(*) FROM released) as releases,
+                      (SELECT COUNT(*) FROM published_tracks) as tracks,
+                      (SELECT COUNT(*) FROM notified) as notifications""",
+            (batch_size,)
+        )
+        batch = cur.fetchone()
+        conn.commit()
+        
+        if not batch['releases']:
+            break
+        totals['batches'] += 1
+        for key in ('releases', 'tracks', 'notifications'):
+            totals[key] += batch[key]
+        if batch['releases'] < batch_size:
+            break
+    
+    cur.close()
+    totals['elapsed_ms'] = round((time.monotonic() - started) * 1000)
+    return totals
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -23,13 +346,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    conn = None
+    etag = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -38,6 +363,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         resource = params.get('resource', 'labels')
         
         if method == 'GET':
+            if resource in ETAG_TABLES:
+                etag = read_etag(cur, ETAG_TABLES[resource], params)
+                if etag_matches(event, etag):
+                    return not_modified_response(etag)
+            
             if resource == 'labels':
                 label_id = params.get('label_id')
                 user_id = params.get('user_id')
@@ -60,24 +390,40 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     )
                     row = cur.fetchone()
                     result = dict(row) if row else None
-                elif user_id:
-                    cur.execute(
-                        """SELECT l.*, COUNT(la.user_id) as artist_count
-                           FROM labels l
-                           LEFT JOIN label_artists la ON l.id = la.label_id
-                           WHERE l.owner_id = %s OR la.user_id = %s
-                           GROUP BY l.id""",
-                        (int(user_id), int(user_id))
-                    )
-                    result = [dict(row) for row in cur.fetchall()]
                 else:
-                    cur.execute(
-                        """SELECT l.*, COUNT(la.user_id) as artist_count
-                           FROM labels l
-                           LEFT JOIN label_artists la ON l.id = la.label_id
-                           GROUP BY l.id"""
-                    )
-                    result = [dict(row) for row in cur.fetchall()]
+                    query = """SELECT l.*, COUNT(la.user_id) as artist_count
+                               FROM labels l
+                               LEFT JOIN label_artists la ON l.id = la.label_id"""
+                    params_list = []
+                    
+                    if user_id:
+                        query += " WHERE l.owner_id = %s OR la.user_id = %s"
+                        params_list.extend([int(user_id), int(user_id)])
+                    
+                    query += " GROUP BY l.id"
+                    
+                    if params.get('render') == 'db':
+                        result = render_json_rows(conn, query, params_list)
+                    elif params.get('stream'):
+                        result = stream_json_rows(conn, query, params_list)
+                    else:
+                        cur.execute(query, params_list)
+                        result = [dict(row) for row in cur.fetchall()]
+            
+            elif resource == 'performance':
+                result = label_performance(cur, params)
+            
+            elif resource == 'split_rules' and not str(params.get('label_id') or '').isdigit():
+                result = {'error': 'label_id is required'}
+            
+            elif resource == 'split_rules':
+                cur.execute(
+                    """SELECT * FROM royalty_split_rules
+                       WHERE label_id = %s
+                       ORDER BY user_id NULLS FIRST""",
+                    (int(params['label_id']),)
+                )
+                result = [dict(row) for row in cur.fetchall()]
             
             elif resource == 'releases':
                 user_id = params.get('user_id')
@@ -105,16 +451,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 query += " ORDER BY r.release_date ASC"
                 
-                cur.execute(query, params_list)
-                result = [dict(row) for row in cur.fetchall()]
+                if params.get('render') == 'db':
+                    result = render_json_rows(conn, query, params_list)
+                elif params.get('stream'):
+                    result = stream_json_rows(conn, query, params_list)
+                else:
+                    cur.execute(query, params_list)
+                    result = [dict(row) for row in cur.fetchall()]
             
             else:
                 result = {'error': 'Unknown resource'}
         
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             
-            if resource == 'labels':
+            if resource == 'releases' and params.get('action') == 'publish_due':
+                result = publish_due_releases(conn, params)
+            
+            elif resource == 'split_rules':
+                cur.execute(
+                    """INSERT INTO royalty_split_rules (label_id, user_id, label_share)
+                       VALUES (%s, %s, %s)
+                       ON CONFLICT (label_id, COALESCE(user_id, 0)) DO UPDATE SET
+                         label_share = EXCLUDED.label_share,
+                         updated_at = CURRENT_TIMESTAMP
+                       RETURNING *""",
+                    (body_data['label_id'], body_data.get('user_id'), str(body_data['label_share']))
+                )
+                conn.commit()
+                result = dict(cur.fetchone())
+            
+            elif resource == 'labels':
                 cur.execute(
                     """INSERT INTO labels (owner_id, name, description, logo_url, website)
                        VALUES (%s, %s, %s, %s, %s)
@@ -152,7 +519,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 result = {'error': 'Unknown resource'}
         
         elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             
             if resource == 'labels':
                 update_fields = []
@@ -201,12 +568,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result = {'error': 'Method not allowed'}
         
         cur.close()
-        conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(result, default=str),
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-DB-Pool': db_pool_header(), **etag_headers(etag)},
+            'body': result if isinstance(result, RawJSON) else json.dumps(result, default=str),
             'isBase64Encoded': False
         }
     
@@ -217,3 +583,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
@@ -4,15 +4,613 @@ Args: event with httpMethod, body, queryStringParameters
 Returns: HTTP response with social data
 '''
 
+import base64
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import select
+import time
+from typing import Dict, Any, List, Tuple, Optional
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+
+# Idle connections kept alive between warm invocations: (connection, released_at)
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'discarded': 0, 'in_use': 0}
+
+# Set by backend/batch so in-process sub-requests share one connection and transaction
+_batch_connection = None
+
+def _ping_connection(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
+    if _batch_connection is not None:
+        return _batch_connection
+    
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        stale = time.monotonic() - released_at > DB_POOL_CHECK_INTERVAL
+        if conn.closed or (stale and not _ping_connection(conn)):
+            _db_pool_stats['discarded'] += 1
+            conn.close()
+            continue
+        _db_pool_stats['hits'] += 1
+        _db_pool_stats['in_use'] += 1
+        return conn
+    
+    if _db_pool_stats['in_use'] >= DB_POOL_MAX_SIZE:
+        raise PoolError('connection pool exhausted')
+    
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    _db_pool_stats['misses'] += 1
+    _db_pool_stats['in_use'] += 1
+    return conn
+
+def release_db_connection(conn) -> None:
+    if conn is _batch_connection:
+        return
+    
+    _db_pool_stats['in_use'] -= 1
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN:
+        try:
+            conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if len(_db_pool) < DB_POOL_MAX_SIZE:
+                _db_pool.append((conn, time.monotonic()))
+                return
+        except psycopg2.Error:
+            pass
+    _db_pool_stats['discarded'] += 1
+    conn.close()
+
+def db_pool_header() -> str:
+    stats = dict(_db_pool_stats, idle=len(_db_pool))
+    return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+ETAG_TABLES = {
+    'comments': ('comments', 'users'),
+    'messages': ('messages', 'users'),
+    'conversations': ('messages', 'users'),
+    'playlists': ('playlists', 'playlist_tracks', 'tracks'),
+    'playlist_tracks': ('playlist_tracks', 'tracks'),
+    'notifications': ('notifications',),
+}
+
+def read_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> str:
+    '''Strong ETag from the change counters of every table a GET reads, plus its parameters'''
+    cur.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    stamp = [[row['table_name'], row['version']] for row in cur.fetchall()]
+    key = json.dumps([stamp, sorted(params.items())], default=str)
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    candidates = [tag.strip() for tag in headers.get('if-none-match', '').split(',')]
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in candidates)
+
+def etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Expose-Headers': 'ETag'} if etag else {}
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **etag_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+MESSAGE_PAGE_DEFAULT_LIMIT = 50
+MESSAGE_PAGE_MAX_LIMIT = 200
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str, size: int) -> Optional[List[Any]]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) and len(values) == size else None
+
+def page_size(params: Dict[str, Any]) -> int:
+    return max(1, min(int(params.get('limit') or MESSAGE_PAGE_DEFAULT_LIMIT), MESSAGE_PAGE_MAX_LIMIT))
+
+def list_conversations(cur, user_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Inbox page: one row per peer with the last message and the unread count, newest first'''
+    limit = page_size(params)
+    cursor_sql = ''
+    values: List[Any] = [user_id]
+    if params.get('cursor'):
+        cursor_values = decode_cursor(params['cursor'], 2)
+        if cursor_values is None:
+            return {'error': 'Invalid cursor'}
+        cursor_sql = " AND (c.last_message_at, c.peer_id) < (%s::timestamp, %s)"
+        values += [cursor_values[0], int(cursor_values[1])]
+    
+    cur.execute(
+        f"""SELECT c.peer_id, c.unread_count, c.last_message_at,
+                  u.username as peer_username, u.full_name as peer_name, u.avatar_url as peer_avatar_url,
+                  m.id as last_message_id, m.sender_id as last_message_sender_id,
+                  m.content as last_message, m.track_id as last_message_track_id
+           FROM conversations c
+           JOIN users u ON u.id = c.peer_id
+           JOIN messages m ON m.id = c.last_message_id
+           WHERE c.user_id = %s{cursor_sql}
+           ORDER BY c.last_message_at DESC, c.peer_id DESC
+           LIMIT %s""",
+        values + [limit + 1]
+    )
+    rows = [dict(row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['last_message_at'], rows[-1]['peer_id']])
+    
+    cur.execute(
+        "SELECT COALESCE(SUM(unread_count), 0) as unread_total FROM conversations WHERE user_id = %s",
+        (user_id,)
+    )
+    return {'items': rows, 'next_cursor': next_cursor, 'unread_total': cur.fetchone()['unread_total']}
+
+def list_conversation_messages(cur, user_id: int, peer_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''History between two users, newest first, paged by (created_at, id) on the pair index'''
+    limit = page_size(params)
+    cursor_sql = ''
+    values: List[Any] = [min(user_id, peer_id), max(user_id, peer_id)]
+    if params.get('cursor'):
+        cursor_values = decode_cursor(params['cursor'], 2)
+        if cursor_values is None:
+            return {'error': 'Invalid cursor'}
+        cursor_sql = " AND (m.created_at, m.id) < (%s::timestamp, %s)"
+        values += [cursor_values[0], int(cursor_values[1])]
+    
+    cur.execute(
+        f"""SELECT m.*
+           FROM messages m
+           WHERE LEAST(m.sender_id, m.receiver_id) = %s
+             AND GREATEST(m.sender_id, m.receiver_id) = %s{cursor_sql}
+           ORDER BY m.created_at DESC, m.id DESC
+           LIMIT %s""",
+        values + [limit + 1]
+    )
+    rows = [dict(row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['created_at'], rows[-1]['id']])
+    return {'items': rows, 'next_cursor': next_cursor}
+
+def mark_conversation_read(conn, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Mark everything peer_id sent to user_id as read, optionally only up to up_to_id'''
+    cur = conn.cursor()
+    up_to_sql = ''
+    values = [int(body_data['user_id']), int(body_data['peer_id'])]
+    if body_data.get('up_to_id'):
+        up_to_sql = " AND id <= %s"
+        values.append(int(body_data['up_to_id']))
+    
+    cur.execute(
+        f"""UPDATE messages SET is_read = true
+           WHERE receiver_id = %s AND sender_id = %s AND is_read = false{up_to_sql}""",
+        values
+    )
+    marked = cur.rowcount
+    cur.execute(
+        "SELECT unread_count FROM conversations WHERE user_id = %s AND peer_id = %s",
+        values[:2]
+    )
+    row = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return {'marked': marked, 'unread_count': row['unread_count'] if row else 0}
+
+USER_ROLES = ('artist', 'moderator', 'manager', 'admin')
+FANOUT_MAX_USER_IDS = 10000
+
+def fanout_notifications(conn, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''One INSERT ... SELECT creating the same notification for a whole audience'''
+    if body_data.get('label_id'):
+        audience_sql = "SELECT DISTINCT user_id FROM label_artists WHERE label_id = %s AND user_id IS NOT NULL"
+        audience_values: List[Any] = [int(body_data['label_id'])]
+    elif body_data.get('role'):
+        if body_data['role'] not in USER_ROLES:
+            return {'error': f"role must be one of {', '.join(USER_ROLES)}"}
+        audience_sql = "SELECT id FROM users WHERE role = %s"
+        audience_values = [body_data['role']]
+    elif body_data.get('user_ids'):
+        user_ids = [int(v) for v in body_data['user_ids']]
+        if len(user_ids) > FANOUT_MAX_USER_IDS:
+            return {'error': f'Up to {FANOUT_MAX_USER_IDS} user_ids per request'}
+        audience_sql = "SELECT id FROM users WHERE id = ANY(%s)"
+        audience_values = [user_ids]
+    else:
+        return {'error': 'label_id, role or user_ids is required'}
+    
+    exclude_sql = ''
+    if body_data.get('exclude_user_id'):
+        exclude_sql = " WHERE audience.user_id <> %s"
+        audience_values.append(int(body_data['exclude_user_id']))
+    
+    cur = conn.cursor()
+    cur.execute(
+        f"""INSERT INTO notifications (user_id, type, title, message, link)
+           SELECT audience.user_id, %s, %s, %s, %s
+           FROM ({audience_sql}) AS audience(user_id){exclude_sql}""",
+        [body_data['type'], body_data['title'], body_data['message'], body_data.get('link')] + audience_values
+    )
+    created = cur.rowcount
+    conn.commit()
+    cur.close()
+    return {'created': created}
+
+def mark_notifications_read(conn, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Mark all of a user's unread notifications read, optionally only up to an id or a time'''
+    cur = conn.cursor()
+    bound_sql = ''
+    values: List[Any] = [int(body_data['user_id'])]
+    if body_data.get('up_to_id'):
+        bound_sql += " AND id <= %s"
+        values.append(int(body_data['up_to_id']))
+    if body_data.get('up_to'):
+        bound_sql += " AND created_at <= %s::timestamp"
+        values.append(body_data['up_to'])
+    
+    cur.execute(
+        f"""UPDATE notifications SET is_read = true
+           WHERE user_id = %s AND is_read = false{bound_sql}""",
+        values
+    )
+    marked = cur.rowcount
+    conn.commit()
+    cur.close()
+    return {'marked': marked}
+
+FEED_MAX_ITEMS = 100
+FEED_DEFAULT_TIMEOUT = 20
+FEED_MAX_TIMEOUT = 25
+# Ids are taken at INSERT but become visible at COMMIT, so a row can show up below an id already
+# delivered. Each poll re-reads this many ids behind the cursor, skipping the ones it already sent.
+FEED_LOOKBACK_IDS = int(os.environ.get('FEED_LOOKBACK_IDS', '1000'))
+
+def feed_high_water(cur) -> Dict[str, Any]:
+    cur.execute(
+        """SELECT (SELECT COALESCE(MAX(id), 0) FROM messages) as messages,
+                  (SELECT COALESCE(MAX(id), 0) FROM notifications) as notifications"""
+    )
+    return dict(cur.fetchone())
+
+def read_feed_rows(cur, table: str, branches: List[Tuple[str, List[Any]]], after: int, seen: List[int]) -> List[Dict[str, Any]]:
+    # One (user, id) index range per branch, merged by id, from the lookback window onwards
+    union_sql = ' UNION ALL '.join(
+        f"(SELECT * FROM {table} WHERE {condition} AND id > %s AND id <> ALL(%s) ORDER BY id LIMIT %s)"
+        for condition, _ in branches
+    )
+    values: List[Any] = []
+    for _, branch_values in branches:
+        values += branch_values + [after - FEED_LOOKBACK_IDS, seen, FEED_MAX_ITEMS]
+    cur.execute(f"{union_sql} ORDER BY id LIMIT %s", values + [FEED_MAX_ITEMS])
+    return [dict(row) for row in cur.fetchall()]
+
+def read_feed(cur, user_id: int, since: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+    message_after, notification_after, message_seen, notification_seen = since
+    # Read before the rows: everything up to it is either returned now or still in flight,
+    # and in-flight rows stay inside the lookback window of the advanced cursor
+    high_water = feed_high_water(cur)
+    messages = read_feed_rows(
+        cur, 'messages',
+        [("receiver_id = %s", [user_id]), ("sender_id = %s AND receiver_id IS DISTINCT FROM %s", [user_id, user_id])],
+        message_after, message_seen
+    )
+    notifications = read_feed_rows(
+        cur, 'notifications', [("user_id = %s", [user_id])], notification_after, notification_seen
+    )
+    return messages, notifications, high_water
+
+def advance_feed_cursor(after: int, seen: List[int], rows: List[Dict[str, Any]], high_water: int) -> Tuple[int, List[int]]:
+    '''Move the high-water mark past delivered rows, remembering delivered ids still inside the lookback window.
+    
+    A short page means nothing else of the user's is visible up to the table's high-water mark, so the
+    cursor jumps there; otherwise a quiet user's window would trail further behind every poll.
+    '''
+    after = max([after] + [row['id'] for row in rows])
+    if len(rows) < FEED_MAX_ITEMS:
+        after = max(after, high_water)
+    seen = sorted(set(seen).union(row['id'] for row in rows))
+    return after, [row_id for row_id in seen if row_id > after - FEED_LOOKBACK_IDS]
+
+def long_poll_feed(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''New messages and notifications after the `since` cursor, waiting on LISTEN up to `timeout` seconds'''
+    user_id = int(params['user_id'])
+    timeout = max(0.0, min(float(params.get('timeout') or FEED_DEFAULT_TIMEOUT), FEED_MAX_TIMEOUT))
+    cur = conn.cursor()
+    
+    if not params.get('since'):
+        row = feed_high_water(cur)
+        return {'messages': [], 'notifications': [], 'cursor': encode_cursor([row['messages'], row['notifications'], [], []])}
+    
+    since = decode_cursor(params['since'], 4)
+    if since is None:
+        return {'error': 'Invalid cursor'}
+    try:
+        since = [int(since[0]), int(since[1]), [int(v) for v in since[2]], [int(v) for v in since[3]]]
+    except (ValueError, TypeError):
+        return {'error': 'Invalid cursor'}
+    
+    # Notifications are only delivered outside a transaction, and a batch shares its connection
+    blocking = timeout > 0 and conn is not _batch_connection
+    if blocking:
+        conn.rollback()
+        conn.autocommit = True
+        cur.execute(f"LISTEN social_user_{user_id}")
+    
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            messages, notifications, high_water = read_feed(cur, user_id, since)
+            remaining = deadline - time.monotonic()
+            if messages or notifications or not blocking or remaining <= 0:
+                break
+            if select.select([conn], [], [], remaining) == ([], [], []):
+                continue
+            conn.poll()
+            conn.notifies.clear()
+    finally:
+        if blocking:
+            cur.execute("UNLISTEN *")
+            conn.autocommit = False
+    
+    message_after, message_seen = advance_feed_cursor(since[0], since[2], messages, high_water['messages'])
+    notification_after, notification_seen = advance_feed_cursor(since[1], since[3], notifications, high_water['notifications'])
+    return {
+        'messages': messages,
+        'notifications': notifications,
+        'cursor': encode_cursor([message_after, notification_after, message_seen, notification_seen])
+    }
+
+PLAYLIST_RANK_GAP = 1 << 16
+PLAYLIST_PAGE_DEFAULT_LIMIT = 100
+PLAYLIST_PAGE_MAX_LIMIT = 500
+PLAYLIST_BULK_MAX = 1000
+
+def list_playlist_tracks(cur, playlist_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''One page of a playlist in position order, keyset-paged by (position, id)'''
+    limit = max(1, min(int(params.get('limit') or PLAYLIST_PAGE_DEFAULT_LIMIT), PLAYLIST_PAGE_MAX_LIMIT))
+    cursor_sql = ''
+    values: List[Any] = [playlist_id]
+    if params.get('cursor'):
+        cursor_values = decode_cursor(params['cursor'], 2)
+        if cursor_values is None:
+            return {'error': 'Invalid cursor'}
+        cursor_sql = " AND (pt.position, pt.id) > (%s, %s)"
+        values += [int(cursor_values[0]), int(cursor_values[1])]
+    
+    cur.execute(
+        f"""SELECT pt.id, t.id as track_id, t.title, t.artist, pt.position, pt.added_at
+           FROM playlist_tracks pt
+           JOIN tracks t ON pt.track_id = t.id
+           WHERE pt.playlist_id = %s{cursor_sql}
+           ORDER BY pt.position, pt.id
+           LIMIT %s""",
+        values + [limit + 1]
+    )
+    rows = [dict(row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['position'], rows[-1]['id']])
+    for row in rows:
+        del row['id']
+    return {'items': rows, 'next_cursor': next_cursor}
+
+def renumber_playlist(cur, playlist_id: int) -> int:
+    '''Spread positions back out to PLAYLIST_RANK_GAP steps, keeping the current order'''
+    cur.execute(
+        """UPDATE playlist_tracks pt SET position = r.rn * %s
+           FROM (
+             SELECT id, ROW_NUMBER() OVER (ORDER BY position, id) AS rn
+             FROM playlist_tracks
+             WHERE playlist_id = %s
+           ) r
+           WHERE pt.id = r.id AND pt.position <> r.rn * %s""",
+        (PLAYLIST_RANK_GAP, playlist_id, PLAYLIST_RANK_GAP)
+    )
+    return cur.rowcount
+
+def playlist_neighbour_positions(cur, playlist_id: int, body_data: Dict[str, Any], moving: List[int]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    '''(lower, upper) positions the moving tracks go between; None if the anchor track is not in the playlist'''
+    anchor_id = body_data.get('after_track_id') or body_data.get('before_track_id')
+    if not anchor_id:
+        cur.execute(
+            "SELECT MAX(position) as position FROM playlist_tracks WHERE playlist_id = %s AND track_id <> ALL(%s)",
+            (playlist_id, moving)
+        )
+        return cur.fetchone()['position'], None
+    
+    cur.execute(
+        "SELECT id, position FROM playlist_tracks WHERE playlist_id = %s AND track_id = %s",
+        (playlist_id, int(anchor_id))
+    )
+    anchor = cur.fetchone()
+    if not anchor or int(anchor_id) in moving:
+        return None
+    
+    if body_data.get('after_track_id'):
+        cur.execute(
+            """SELECT position FROM playlist_tracks
+               WHERE playlist_id = %s AND (position, id) > (%s, %s) AND track_id <> ALL(%s)
+               ORDER BY position, id
+               LIMIT 1""",
+            (playlist_id, anchor['position'], anchor['id'], moving)
+        )
+        row = cur.fetchone()
+        return anchor['position'], row['position'] if row else None
+    
+    cur.execute(
+        """SELECT position FROM playlist_tracks
+           WHERE playlist_id = %s AND (position, id) < (%s, %s) AND track_id <> ALL(%s)
+           ORDER BY position DESC, id DESC
+           LIMIT 1""",
+        (playlist_id, anchor['position'], anchor['id'], moving)
+    )
+    row = cur.fetchone()
+    return row['position'] if row else None, anchor['position']
+
+def allocate_positions(lower: Optional[int], upper: Optional[int], count: int) -> Optional[List[int]]:
+    '''`count` evenly spaced positions strictly between lower and upper; None when there is no room'''
+    if upper is None:
+        start = lower or 0
+        return [start + PLAYLIST_RANK_GAP * (i + 1) for i in range(count)]
+    if lower is None:
+        lower = upper - PLAYLIST_RANK_GAP * (count + 1)
+    step = (upper - lower) // (count + 1)
+    if step < 1:
+        return None
+    return [lower + step * (i + 1) for i in range(count)]
+
+def place_playlist_tracks(conn, body_data: Dict[str, Any], track_ids: List[int]) -> Dict[str, Any]:
+    '''Insert or move tracks as a block after/before an anchor track (default: the end), touching only their rows'''
+    playlist_id = int(body_data['playlist_id'])
+    track_ids = list(dict.fromkeys(int(v) for v in track_ids))
+    if not 0 < len(track_ids) <= PLAYLIST_BULK_MAX:
+        return {'error': f'Between 1 and {PLAYLIST_BULK_MAX} track_ids per request'}
+    
+    cur = conn.cursor()
+    # Serializes concurrent reorders of the same playlist
+    cur.execute("SELECT id FROM playlists WHERE id = %s FOR UPDATE", (playlist_id,))
+    if not cur.fetchone():
+        conn.rollback()
+        return {'error': 'Playlist not found'}
+    
+    renumbered = False
+    while True:
+        bounds = playlist_neighbour_positions(cur, playlist_id, body_data, track_ids)
+        if bounds is None:
+            conn.rollback()
+            return {'error': 'Anchor track is not in the playlist'}
+        positions = allocate_positions(bounds[0], bounds[1], len(track_ids))
+        if positions is not None:
+            break
+        if renumbered:
+            conn.rollback()
+            return {'error': 'No room to place tracks'}
+        # Gap between the neighbours is used up: spread the playlist out once and retry
+        renumber_playlist(cur, playlist_id)
+        renumbered = True
+    
+    cur.execute(
+        """INSERT INTO playlist_tracks (playlist_id, track_id, position)
+           SELECT %s, t.track_id, t.position
+           FROM unnest(%s::int[], %s::bigint[]) AS t(track_id, position)
+           ON CONFLICT (playlist_id, track_id) DO UPDATE SET position = EXCLUDED.position
+           RETURNING *""",
+        (playlist_id, track_ids, positions)
+    )
+    rows = [dict(row) for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    return {'items': rows, 'renumbered': renumbered}
+
+def legacy_playlist_anchor(cur, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''Translate a 1-based ordinal `position` into "before the track currently there"'''
+    cur.execute(
+        """SELECT track_id FROM playlist_tracks
+           WHERE playlist_id = %s AND track_id <> %s
+           ORDER BY position, id
+           OFFSET %s
+           LIMIT 1""",
+        (int(body_data['playlist_id']), int(body_data['track_id']), max(int(body_data['position']) - 1, 0))
+    )
+    row = cur.fetchone()
+    return {'playlist_id': body_data['playlist_id'], 'before_track_id': row['track_id'] if row else None}
+
+COMMENT_PAGE_DEFAULT_LIMIT = 20
+COMMENT_PAGE_MAX_LIMIT = 100
+COMMENT_DEFAULT_REPLIES = 3
+COMMENT_MAX_REPLIES = 20
+
+def list_comment_thread(cur, track_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Top-level comments newest first, each with its first replies; with parent_id, a page of that comment's replies'''
+    limit = max(1, min(int(params.get('limit') or COMMENT_PAGE_DEFAULT_LIMIT), COMMENT_PAGE_MAX_LIMIT))
+    replies_limit = max(0, min(int(params.get('replies') or COMMENT_DEFAULT_REPLIES), COMMENT_MAX_REPLIES))
+    parent_id = params.get('parent_id')
+    
+    cursor_sql = ''
+    values: List[Any] = [track_id]
+    if params.get('cursor'):
+        cursor_values = decode_cursor(params['cursor'], 2)
+        if cursor_values is None:
+            return {'error': 'Invalid cursor'}
+        # Top level reads newest first, replies oldest first
+        cursor_sql = " AND (c.created_at, c.id) > (%s::timestamp, %s)" if parent_id else " AND (c.created_at, c.id) < (%s::timestamp, %s)"
+        cursor_values = [cursor_values[0], int(cursor_values[1])]
+    else:
+        cursor_values = []
+    
+    if parent_id:
+        parent_sql, order_sql = "c.parent_id = %s", "c.created_at, c.id"
+        values.append(int(parent_id))
+    else:
+        parent_sql, order_sql = "c.parent_id IS NULL", "c.created_at DESC, c.id DESC"
+    
+    cur.execute(
+        f"""SELECT c.*, u.username, u.full_name, u.avatar_url
+           FROM comments c
+           JOIN users u ON c.user_id = u.id
+           WHERE c.track_id = %s AND {parent_sql}{cursor_sql}
+           ORDER BY {order_sql}
+           LIMIT %s""",
+        values + cursor_values + [limit + 1]
+    )
+    rows = [dict(row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['created_at'], rows[-1]['id']])
+    
+    if rows and replies_limit:
+        cur.execute(
+            """SELECT r.*, u.username, u.full_name, u.avatar_url
+               FROM unnest(%s::int[]) AS p(id)
+               CROSS JOIN LATERAL (
+                 SELECT * FROM comments c
+                 WHERE c.track_id = %s AND c.parent_id = p.id
+                 ORDER BY c.created_at, c.id
+                 LIMIT %s
+               ) r
+               JOIN users u ON r.user_id = u.id
+               ORDER BY r.parent_id, r.created_at, r.id""",
+            ([row['id'] for row in rows], track_id, replies_limit)
+        )
+        replies: Dict[int, List[Dict[str, Any]]] = {}
+        for reply in cur.fetchall():
+            replies.setdefault(reply['parent_id'], []).append(dict(reply))
+    else:
+        replies = {}
+    
+    for row in rows:
+        row['replies'] = replies.get(row['id'], [])
+        more = row['replies'] and row['reply_count'] > len(row['replies'])
+        row['replies_cursor'] = encode_cursor([row['replies'][-1]['created_at'], row['replies'][-1]['id']]) if more else None
+    
+    return {'items': rows, 'next_cursor': next_cursor}
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -23,22 +621,33 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    conn = None
+    etag = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         
         params = event.get('queryStringParameters') or {}
         resource = params.get('resource', 'comments')
+        action = params.get('action')
         
         if method == 'GET':
-            if resource == 'comments':
+            if resource in ETAG_TABLES:
+                etag = read_etag(cur, ETAG_TABLES[resource], params)
+                if etag_matches(event, etag):
+                    return not_modified_response(etag)
+            
+            if resource == 'comments' and (params.get('threaded') or params.get('parent_id')):
+                result = list_comment_thread(cur, int(params.get('track_id')), params)
+            
+            elif resource == 'comments':
                 track_id = params.get('track_id')
                 cur.execute(
                     """SELECT c.*, u.username, u.full_name, u.avatar_url
@@ -50,21 +659,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 result = [dict(row) for row in cur.fetchall()]
             
+            elif resource == 'feed':
+                result = long_poll_feed(conn, params)
+            
+            elif resource == 'conversations':
+                result = list_conversations(cur, int(params.get('user_id')), params)
+            
             elif resource == 'messages':
                 user_id = params.get('user_id')
-                cur.execute(
-                    """SELECT m.*, 
-                       s.username as sender_username, s.full_name as sender_name,
-                       r.username as receiver_username, r.full_name as receiver_name
-                       FROM messages m
-                       JOIN users s ON m.sender_id = s.id
-                       JOIN users r ON m.receiver_id = r.id
-                       WHERE m.sender_id = %s OR m.receiver_id = %s
-                       ORDER BY m.created_at DESC
-                       LIMIT 50""",
-                    (int(user_id), int(user_id))
-                )
-                result = [dict(row) for row in cur.fetchall()]
+                peer_id = params.get('peer_id')
+                
+                if peer_id:
+                    result = list_conversation_messages(cur, int(user_id), int(peer_id), params)
+                else:
+                    # Each direction is its own ordered range scan; an OR would defeat both indexes
+                    cur.execute(
+                        """SELECT m.*, 
+                           s.username as sender_username, s.full_name as sender_name,
+                           r.username as receiver_username, r.full_name as receiver_name
+                           FROM (
+                             (SELECT * FROM messages WHERE sender_id = %s ORDER BY created_at DESC, id DESC LIMIT 50)
+                             UNION ALL
+                             (SELECT * FROM messages WHERE receiver_id = %s AND sender_id <> receiver_id
+                              ORDER BY created_at DESC, id DESC LIMIT 50)
+                           ) m
+                           JOIN users s ON m.sender_id = s.id
+                           JOIN users r ON m.receiver_id = r.id
+                           ORDER BY m.created_at DESC, m.id DESC
+                           LIMIT 50""",
+                        (int(user_id), int(user_id))
+                    )
+                    result = [dict(row) for row in cur.fetchall()]
             
             elif resource == 'playlists':
                 user_id = params.get('user_id')
@@ -72,22 +697,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 if playlist_id:
                     cur.execute(
-                        """SELECT p.*, 
-                           array_agg(json_build_object(
-                             'track_id', t.id,
-                             'title', t.title,
-                             'artist', t.artist,
-                             'position', pt.position
-                           ) ORDER BY pt.position) as tracks
+                        """SELECT p.*,
+                           (SELECT COUNT(*) FROM playlist_tracks pt WHERE pt.playlist_id = p.id) as track_count
                            FROM playlists p
-                           LEFT JOIN playlist_tracks pt ON p.id = pt.playlist_id
-                           LEFT JOIN tracks t ON pt.track_id = t.id
-                           WHERE p.id = %s
-                           GROUP BY p.id""",
+                           WHERE p.id = %s""",
                         (int(playlist_id),)
                     )
                     row = cur.fetchone()
                     result = dict(row) if row else None
+                    if result:
+                        page = list_playlist_tracks(cur, int(playlist_id), params)
+                        result['tracks'] = page['items']
+                        result['next_cursor'] = page['next_cursor']
                 else:
                     cur.execute(
                         """SELECT p.*, COUNT(pt.track_id) as track_count
@@ -100,6 +721,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     )
                     result = [dict(row) for row in cur.fetchall()]
             
+            elif resource == 'playlist_tracks':
+                result = list_playlist_tracks(cur, int(params.get('playlist_id')), params)
+            
+            elif resource == 'notifications' and action == 'unread_count':
+                cur.execute(
+                    "SELECT COUNT(*) as unread_count FROM notifications WHERE user_id = %s AND is_read = false",
+                    (int(params.get('user_id')),)
+                )
+                result = dict(cur.fetchone())
+            
             elif resource == 'notifications':
                 user_id = params.get('user_id')
                 cur.execute(
@@ -115,7 +746,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 result = {'error': 'Unknown resource'}
         
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             
             if resource == 'comments':
                 cur.execute(
@@ -147,16 +778,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 conn.commit()
                 result = dict(cur.fetchone())
             
-            elif resource == 'playlist_tracks':
-                cur.execute(
-                    """INSERT INTO playlist_tracks (playlist_id, track_id, position)
-                       VALUES (%s, %s, %s)
-                       ON CONFLICT (playlist_id, track_id) DO UPDATE SET position = EXCLUDED.position
-                       RETURNING *""",
-                    (body_data['playlist_id'], body_data['track_id'], body_data['position'])
-                )
+            elif resource == 'playlist_tracks' and action == 'move':
+                result = place_playlist_tracks(conn, body_data, [body_data['track_id']])
+            
+            elif resource == 'playlist_tracks' and action == 'bulk':
+                result = place_playlist_tracks(conn, body_data, body_data.get('track_ids') or [])
+            
+            elif resource == 'playlist_tracks' and action == 'renumber':
+                cur.execute("SELECT id FROM playlists WHERE id = %s FOR UPDATE", (int(body_data['playlist_id']),))
+                result = {'renumbered': renumber_playlist(cur, int(body_data['playlist_id']))}
                 conn.commit()
-                result = dict(cur.fetchone())
+            
+            elif resource == 'playlist_tracks':
+                placed = place_playlist_tracks(conn, legacy_playlist_anchor(cur, body_data), [body_data['track_id']])
+                result = placed['items'][0] if 'items' in placed else placed
+            
+            elif resource == 'notifications' and action == 'fanout':
+                result = fanout_notifications(conn, body_data)
             
             elif resource == 'notifications':
                 cur.execute(
@@ -172,9 +810,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 result = {'error': 'Unknown resource'}
         
         elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
+            
+            if resource == 'conversations':
+                result = mark_conversation_read(conn, body_data)
             
-            if resource == 'messages':
+            elif resource == 'messages':
                 cur.execute(
                     """UPDATE messages SET is_read = true
                        WHERE id = %s
@@ -184,6 +825,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 conn.commit()
                 result = dict(cur.fetchone())
             
+            elif resource == 'notifications' and action == 'read_all':
+                result = mark_notifications_read(conn, body_data)
+            
             elif resource == 'notifications':
                 cur.execute(
                     """UPDATE notifications SET is_read = true
@@ -201,11 +845,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result = {'error': 'Method not allowed'}
         
         cur.close()
-        conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-DB-Pool': db_pool_header(), **etag_headers(etag)},
             'body': json.dumps(result, default=str),
             'isBase64Encoded': False
         }
@@ -217,3 +860,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
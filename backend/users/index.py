@@ -4,15 +4,226 @@ Args: event with httpMethod, body, queryStringParameters
 Returns: HTTP response with user data
 '''
 
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Optional
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, cursor as TupleCursor
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+
+# Idle connections kept alive between warm invocations: (connection, released_at)
+_db_pool: List[Tuple[Any, float]] = []
+_db_pool_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'discarded': 0, 'in_use': 0}
+
+# Set by backend/batch so in-process sub-requests share one connection and transaction
+_batch_connection = None
+
+def _ping_connection(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
+    if _batch_connection is not None:
+        return _batch_connection
+    
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        stale = time.monotonic() - released_at > DB_POOL_CHECK_INTERVAL
+        if conn.closed or (stale and not _ping_connection(conn)):
+            _db_pool_stats['discarded'] += 1
+            conn.close()
+            continue
+        _db_pool_stats['hits'] += 1
+        _db_pool_stats['in_use'] += 1
+        return conn
+    
+    if _db_pool_stats['in_use'] >= DB_POOL_MAX_SIZE:
+        raise PoolError('connection pool exhausted')
+    
     dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    _db_pool_stats['misses'] += 1
+    _db_pool_stats['in_use'] += 1
+    return conn
+
+def release_db_connection(conn) -> None:
+    if conn is _batch_connection:
+        return
+    
+    _db_pool_stats['in_use'] -= 1
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_UNKNOWN:
+        try:
+            conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            if len(_db_pool) < DB_POOL_MAX_SIZE:
+                _db_pool.append((conn, time.monotonic()))
+                return
+        except psycopg2.Error:
+            pass
+    _db_pool_stats['discarded'] += 1
+    conn.close()
+
+def db_pool_header() -> str:
+    stats = dict(_db_pool_stats, idle=len(_db_pool))
+    return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+ETAG_TABLES = ('users',)
+
+def read_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> str:
+    '''Strong ETag from the change counters of every table a GET reads, plus its parameters'''
+    cur.execute(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    stamp = [[row['table_name'], row['version']] for row in cur.fetchall()]
+    key = json.dumps([stamp, sorted(params.items())], default=str)
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    candidates = [tag.strip() for tag in headers.get('if-none-match', '').split(',')]
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in candidates)
+
+def etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Expose-Headers': 'ETag'} if etag else {}
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'Access-Control-Allow-Origin': '*', **etag_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+STREAM_BATCH_SIZE = 1000
+
+class RawJSON(str):
+    '''Response body that is already JSON-encoded and must be sent as is'''
+
+def stream_json_rows(conn, query: str, params_list: List[Any]) -> RawJSON:
+    '''Encode a list query batch by batch from a server-side cursor'''
+    chunks = []
+    with conn.cursor(name='stream_json_rows') as cur:
+        cur.itersize = STREAM_BATCH_SIZE
+        cur.execute(query, params_list)
+        while True:
+            rows = cur.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            chunks.append(json.dumps(rows, default=str)[1:-1])
+    return RawJSON('[' + ', '.join(chunks) + ']')
+
+NON_ASCII_RE = re.compile(r'[^\x00-\x7e]')
+
+# Row-rendering SQL per list query text, built once per warm instance
+_json_render_queries: Dict[str, str] = {}
+
+def _render_column_sql(name: str, type_code: int) -> str:
+    column = f'q."{name}"'
+    if type_code in (16, 20, 21, 23, 26, 700, 701):
+        value = f"{column}::text"
+    elif type_code == 1700:
+        value = f"to_json({column}::text)::text"
+    elif type_code == 1082:
+        value = f"to_json(to_char({column}, 'YYYY-MM-DD'))::text"
+    elif type_code in (1114, 1184):
+        value = (
+            f"to_json(to_char({column}, 'YYYY-MM-DD HH24:MI:SS')"
+            f" || CASE WHEN to_char({column}, 'US') <> '000000' THEN to_char({column}, '.US') ELSE '' END"
+            + (f" || to_char({column}, 'TZH:TZM')" if type_code == 1184 else '')
+            + ")::text"
+        )
+    elif type_code in (114, 3802):
+        value = f"{column}::jsonb::text"
+    else:
+        value = f"to_json({column})::text"
+    return f"'{json.dumps(name)}: ' || coalesce({value}, 'null')"
+
+def render_json_rows(conn, query: str, params_list: List[Any]) -> RawJSON:
+    '''Let Postgres render every row formatted exactly like json.dumps(dict(row), default=str)'''
+    render_query = _json_render_queries.get(query)
+    with conn.cursor(cursor_factory=TupleCursor) as cur:
+        if render_query is None:
+            cur.execute(f"SELECT * FROM ({query}) q LIMIT 0", params_list)
+            row_sql = " || ', ' || ".join(_render_column_sql(column.name, column.type_code) for column in cur.description)
+            render_query = f"SELECT '{{' || {row_sql} || '}}' FROM ({query}) q"
+            _json_render_queries[query] = render_query
+        cur.execute(render_query, params_list)
+        body = '[' + ', '.join(row[0] for row in cur) + ']'
+    if not body.isascii():
+        body = NON_ASCII_RE.sub(lambda match: json.dumps(match.group())[1:-1], body)
+    return RawJSON(body)
+
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', '1024'))
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', '60'))
+
+class ProfileCache:
+    '''Bounded LRU with per-entry TTL, kept at module level across warm invocations.
+    
+    Entries remember the users ETag they were read under and are served only while it is still
+    current, so a write on any instance (counter updates included) forces a re-read; the TTL
+    and explicit invalidation just bound memory and drop entries early.
+    '''
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'stale': 0, 'invalidations': 0}
+    
+    def get(self, key: Tuple[str, Any], validator: str) -> Optional[Dict[str, Any]]:
+        '''Cached value if it was read under `validator`, else None'''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        
+        expires_at, entry_validator, value = entry
+        if expires_at < time.monotonic() or entry_validator != validator:
+            del self.entries[key]
+            self.stats['expired' if expires_at < time.monotonic() else 'stale'] += 1
+            self.stats['misses'] += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return value
+    
+    def put(self, key: Tuple[str, Any], validator: str, value: Dict[str, Any]) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, validator, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+    
+    def invalidate(self, *keys: Tuple[str, Any]) -> None:
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self.stats['invalidations'] += 1
+    
+    def clear(self) -> None:
+        self.stats['invalidations'] += len(self.entries)
+        self.entries.clear()
+    
+    def header(self) -> str:
+        stats = dict(self.stats, size=len(self.entries))
+        return '; '.join(f"{key}={value}" for key, value in stats.items())
+
+_profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -23,13 +234,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    conn = None
+    etag = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -37,24 +250,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         params = event.get('queryStringParameters') or {}
         
         if method == 'GET':
+            etag = read_etag(cur, ETAG_TABLES, params)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+            
             user_id = params.get('id')
             username = params.get('username')
             role = params.get('role')
             
-            if user_id:
+            cache_key = ('id', int(user_id)) if user_id else ('username', username)
+            cached = _profile_cache.get(cache_key, etag) if user_id or username else None
+            
+            if cached is not None:
+                result = cached
+            elif user_id:
                 cur.execute(
-                    """SELECT u.*, 
-                       COUNT(DISTINCT t.id) as total_tracks,
-                       SUM(t.streams) as total_streams,
-                       SUM(t.revenue) as total_revenue
-                       FROM users u
-                       LEFT JOIN tracks t ON u.id = t.user_id
-                       WHERE u.id = %s
-                       GROUP BY u.id""",
+                    """SELECT * FROM users WHERE id = %s""",
                     (int(user_id),)
                 )
                 row = cur.fetchone()
                 result = dict(row) if row else None
+                if result:
+                    _profile_cache.put(cache_key, etag, result)
             elif username:
                 cur.execute(
                     """SELECT * FROM users WHERE username = %s""",
@@ -62,25 +279,37 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 row = cur.fetchone()
                 result = dict(row) if row else None
+                if result:
+                    _profile_cache.put(cache_key, etag, result)
             else:
-                query = """SELECT u.*, 
-                           COUNT(DISTINCT t.id) as total_tracks
-                           FROM users u
-                           LEFT JOIN tracks t ON u.id = t.user_id
-                           WHERE 1=1"""
+                query = "SELECT u.* FROM users u WHERE 1=1"
                 params_list = []
                 
                 if role:
                     query += " AND u.role = %s"
                     params_list.append(role)
                 
-                query += " GROUP BY u.id ORDER BY u.created_at DESC"
+                query += " ORDER BY u.created_at DESC"
                 
-                cur.execute(query, params_list)
-                result = [dict(row) for row in cur.fetchall()]
+                if params.get('render') == 'db':
+                    result = render_json_rows(conn, query, params_list)
+                elif params.get('stream'):
+                    result = stream_json_rows(conn, query, params_list)
+                else:
+                    cur.execute(query, params_list)
+                    result = [dict(row) for row in cur.fetchall()]
+        
+        elif method == 'POST' and params.get('action') == 'reconcile_counters':
+            apply_fix = params.get('dry_run') not in ('1', 'true')
+            cur.execute("SELECT * FROM reconcile_user_track_counters(%s)", (apply_fix,))
+            drifted = [dict(row) for row in cur.fetchall()]
+            conn.commit()
+            if apply_fix and drifted:
+                _profile_cache.clear()
+            result = {'fixed': apply_fix, 'drifted_count': len(drifted), 'drifted': drifted}
         
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             
             cur.execute(
                 """INSERT INTO users (email, username, full_name, role, bio, avatar_url)
@@ -93,7 +322,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result = dict(cur.fetchone())
         
         elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
+            body_data = json.loads(event.get('body') or '{}')
             user_id = body_data.get('id')
             
             update_fields = []
@@ -113,6 +342,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 cur.execute(query, params_list)
                 conn.commit()
                 result = dict(cur.fetchone())
+                _profile_cache.invalidate(('id', result['id']), ('username', result['username']))
             else:
                 result = {'error': 'No fields to update'}
         
@@ -120,12 +350,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             result = {'error': 'Method not allowed'}
         
         cur.close()
-        conn.close()
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(result, default=str),
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-DB-Pool': db_pool_header(), 'X-Profile-Cache': _profile_cache.header(), **etag_headers(etag)},
+            'body': result if isinstance(result, RawJSON) else json.dumps(result, default=str),
             'isBase64Encoded': False
         }
     
@@ -136,3 +365,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)}),
             'isBase64Encoded': False
         }
+    
+    finally:
+        if conn is not None:
+            release_db_connection(conn)
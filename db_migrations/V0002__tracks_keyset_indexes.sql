@@ -0,0 +1,26 @@
+-- Keyset pagination over tracks orders by (sort column, id), so sort columns must never be NULL
+UPDATE tracks SET upload_date = created_at WHERE upload_date IS NULL AND created_at IS NOT NULL;
+UPDATE tracks SET upload_date = CURRENT_TIMESTAMP WHERE upload_date IS NULL;
+UPDATE tracks SET created_at = upload_date WHERE created_at IS NULL;
+UPDATE tracks SET updated_at = created_at WHERE updated_at IS NULL;
+UPDATE tracks SET streams = 0 WHERE streams IS NULL;
+UPDATE tracks SET revenue = 0.00 WHERE revenue IS NULL;
+
+ALTER TABLE tracks ALTER COLUMN upload_date SET NOT NULL;
+ALTER TABLE tracks ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE tracks ALTER COLUMN updated_at SET NOT NULL;
+ALTER TABLE tracks ALTER COLUMN streams SET NOT NULL;
+ALTER TABLE tracks ALTER COLUMN revenue SET NOT NULL;
+
+-- One (sort column, id) index per allowed sort_by; each serves both ASC and DESC scans
+CREATE INDEX IF NOT EXISTS idx_tracks_upload_date_id ON tracks(upload_date, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_created_at_id ON tracks(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_updated_at_id ON tracks(updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_title_id ON tracks(title, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_artist_id ON tracks(artist, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_streams_id ON tracks(streams, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_revenue_id ON tracks(revenue, id);
+
+-- Default page for the most common filters: moderation queue and an artist's own catalog
+CREATE INDEX IF NOT EXISTS idx_tracks_status_upload_date_id ON tracks(status, upload_date, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_user_upload_date_id ON tracks(user_id, upload_date, id);
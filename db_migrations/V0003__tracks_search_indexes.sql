@@ -0,0 +1,20 @@
+-- Full-text and fuzzy search over tracks
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Search document for a track; title matches outrank artist matches.
+-- 'simple' keeps titles in any language searchable without stemming.
+CREATE OR REPLACE FUNCTION track_search_document(title TEXT, artist TEXT)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(artist, '')), 'B')
+$$;
+
+-- Expression index keeps the document maintained by Postgres on every write
+-- without adding a tsvector column to SELECT t.* / RETURNING * payloads
+CREATE INDEX IF NOT EXISTS idx_tracks_search_document ON tracks USING gin (track_search_document(title, artist));
+
+-- Trigram indexes serve typo-tolerant similarity matches and the legacy ILIKE '%term%' filter
+CREATE INDEX IF NOT EXISTS idx_tracks_title_trgm ON tracks USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_tracks_artist_trgm ON tracks USING gin (artist gin_trgm_ops);
@@ -0,0 +1,163 @@
+-- Pre-aggregated analytics rollups, maintained incrementally from writes to analytics
+CREATE TABLE IF NOT EXISTS analytics_daily_track (
+    track_id INTEGER NOT NULL REFERENCES tracks(id),
+    date DATE NOT NULL,
+    streams BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+    PRIMARY KEY (track_id, date)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_user (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    date DATE NOT NULL,
+    streams BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00,
+    PRIMARY KEY (user_id, date)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_daily_platform (
+    date DATE PRIMARY KEY,
+    streams BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00
+);
+
+CREATE TABLE IF NOT EXISTS analytics_total_track (
+    track_id INTEGER PRIMARY KEY REFERENCES tracks(id),
+    user_id INTEGER REFERENCES users(id),
+    streams BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00
+);
+
+CREATE TABLE IF NOT EXISTS analytics_total_user (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    streams BIGINT NOT NULL DEFAULT 0,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00
+);
+
+CREATE INDEX IF NOT EXISTS idx_analytics_total_track_user_revenue ON analytics_total_track(user_id, revenue DESC);
+
+-- Add a (track_id, date) -> (streams, revenue) delta to every rollup
+CREATE OR REPLACE FUNCTION apply_analytics_rollup_delta(
+    track_ids INTEGER[], dates DATE[], stream_deltas BIGINT[], revenue_deltas DECIMAL[]
+) RETURNS VOID
+LANGUAGE sql
+AS $$
+    WITH delta AS (
+        SELECT d.track_id, d.date, d.streams, d.revenue, t.user_id
+        FROM unnest(track_ids, dates, stream_deltas, revenue_deltas) AS d(track_id, date, streams, revenue)
+        LEFT JOIN tracks t ON t.id = d.track_id
+    ),
+    daily_track AS (
+        INSERT INTO analytics_daily_track (track_id, date, streams, revenue)
+        SELECT track_id, date, SUM(streams), SUM(revenue) FROM delta
+        WHERE track_id IS NOT NULL
+        GROUP BY track_id, date
+        ON CONFLICT (track_id, date) DO UPDATE SET
+            streams = analytics_daily_track.streams + EXCLUDED.streams,
+            revenue = analytics_daily_track.revenue + EXCLUDED.revenue
+    ),
+    daily_user AS (
+        INSERT INTO analytics_daily_user (user_id, date, streams, revenue)
+        SELECT user_id, date, SUM(streams), SUM(revenue) FROM delta
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, date
+        ON CONFLICT (user_id, date) DO UPDATE SET
+            streams = analytics_daily_user.streams + EXCLUDED.streams,
+            revenue = analytics_daily_user.revenue + EXCLUDED.revenue
+    ),
+    daily_platform AS (
+        INSERT INTO analytics_daily_platform (date, streams, revenue)
+        SELECT date, SUM(streams), SUM(revenue) FROM delta
+        GROUP BY date
+        ON CONFLICT (date) DO UPDATE SET
+            streams = analytics_daily_platform.streams + EXCLUDED.streams,
+            revenue = analytics_daily_platform.revenue + EXCLUDED.revenue
+    ),
+    total_track AS (
+        INSERT INTO analytics_total_track (track_id, user_id, streams, revenue)
+        SELECT track_id, user_id, SUM(streams), SUM(revenue) FROM delta
+        WHERE track_id IS NOT NULL
+        GROUP BY track_id, user_id
+        ON CONFLICT (track_id) DO UPDATE SET
+            user_id = EXCLUDED.user_id,
+            streams = analytics_total_track.streams + EXCLUDED.streams,
+            revenue = analytics_total_track.revenue + EXCLUDED.revenue
+    )
+    INSERT INTO analytics_total_user (user_id, streams, revenue)
+    SELECT user_id, SUM(streams), SUM(revenue) FROM delta
+    WHERE user_id IS NOT NULL
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        streams = analytics_total_user.streams + EXCLUDED.streams,
+        revenue = analytics_total_user.revenue + EXCLUDED.revenue;
+$$;
+
+-- Statement-level trigger: one pre-aggregated delta per INSERT/UPDATE/DELETE statement,
+-- so bulk loads pay per (track, day) rather than per row
+CREATE OR REPLACE FUNCTION analytics_rollup_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_analytics_rollup_delta(array_agg(track_id), array_agg(date), array_agg(streams), array_agg(revenue))
+        FROM (
+            SELECT track_id, date, SUM(COALESCE(streams, 0))::BIGINT AS streams, SUM(COALESCE(revenue, 0)) AS revenue
+            FROM new_rows
+            GROUP BY track_id, date
+        ) d
+        HAVING COUNT(*) > 0;
+    END IF;
+    
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM apply_analytics_rollup_delta(array_agg(track_id), array_agg(date), array_agg(streams), array_agg(revenue))
+        FROM (
+            SELECT track_id, date, -SUM(COALESCE(streams, 0))::BIGINT AS streams, -SUM(COALESCE(revenue, 0)) AS revenue
+            FROM old_rows
+            GROUP BY track_id, date
+        ) d
+        HAVING COUNT(*) > 0;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_analytics_rollup_insert ON analytics;
+CREATE TRIGGER trg_analytics_rollup_insert
+    AFTER INSERT ON analytics
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_trigger();
+
+DROP TRIGGER IF EXISTS trg_analytics_rollup_update ON analytics;
+CREATE TRIGGER trg_analytics_rollup_update
+    AFTER UPDATE ON analytics
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_trigger();
+
+DROP TRIGGER IF EXISTS trg_analytics_rollup_delete ON analytics;
+CREATE TRIGGER trg_analytics_rollup_delete
+    AFTER DELETE ON analytics
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_trigger();
+
+-- Full rebuild/backfill from the raw fact table; also fixes drift after tracks change owner
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollups() RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    LOCK TABLE analytics IN SHARE MODE;
+    
+    TRUNCATE analytics_daily_track, analytics_daily_user, analytics_daily_platform,
+             analytics_total_track, analytics_total_user;
+    
+    PERFORM apply_analytics_rollup_delta(array_agg(track_id), array_agg(date), array_agg(streams), array_agg(revenue))
+    FROM (
+        SELECT track_id, date, SUM(COALESCE(streams, 0))::BIGINT AS streams, SUM(COALESCE(revenue, 0)) AS revenue
+        FROM analytics
+        GROUP BY track_id, date
+    ) d
+    HAVING COUNT(*) > 0;
+END;
+$$;
+
+SELECT rebuild_analytics_rollups();
@@ -0,0 +1,14 @@
+-- Strict YYYY-MM-DD parser for staged report rows: returns NULL instead of raising,
+-- so one malformed line is counted as a reject rather than aborting the whole load
+CREATE OR REPLACE FUNCTION parse_iso_date(value TEXT) RETURNS DATE
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT CASE
+        WHEN value ~ '^\s*\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])\s*$' THEN
+            CASE
+                WHEN substr(trim(value), 9, 2)::INTEGER
+                     <= extract(day FROM (substr(trim(value), 1, 7) || '-01')::DATE + INTERVAL '1 month - 1 day')
+                THEN trim(value)::DATE
+            END
+    END
+$$;
@@ -0,0 +1,38 @@
+-- Per-table change counters used to derive ETags for GET responses.
+-- Bumped in the writing transaction, so readers only see a new version once the data is committed.
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name) DO UPDATE SET
+        version = table_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    versioned_table TEXT;
+BEGIN
+    FOREACH versioned_table IN ARRAY ARRAY[
+        'users', 'tracks', 'playlists', 'playlist_tracks', 'comments', 'labels',
+        'label_artists', 'analytics', 'messages', 'notifications', 'releases'
+    ] LOOP
+        INSERT INTO table_versions (table_name) VALUES (versioned_table) ON CONFLICT DO NOTHING;
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_version ON %I', versioned_table, versioned_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+             FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+            versioned_table, versioned_table
+        );
+    END LOOP;
+END;
+$$;
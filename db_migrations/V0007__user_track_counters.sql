@@ -0,0 +1,93 @@
+-- Per-user track totals kept on users instead of aggregating tracks on every profile/list read
+ALTER TABLE users ADD COLUMN IF NOT EXISTS total_tracks INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS total_streams BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS total_revenue DECIMAL(14, 2) NOT NULL DEFAULT 0.00;
+
+-- Applied inside the same transaction as every track INSERT/UPDATE/DELETE
+CREATE OR REPLACE FUNCTION tracks_user_counters_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.user_id IS NOT DISTINCT FROM NEW.user_id THEN
+        IF (OLD.streams, OLD.revenue) IS DISTINCT FROM (NEW.streams, NEW.revenue) AND NEW.user_id IS NOT NULL THEN
+            UPDATE users SET
+                total_streams = total_streams + COALESCE(NEW.streams, 0) - COALESCE(OLD.streams, 0),
+                total_revenue = total_revenue + COALESCE(NEW.revenue, 0) - COALESCE(OLD.revenue, 0)
+            WHERE id = NEW.user_id;
+        END IF;
+        RETURN NULL;
+    END IF;
+    
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.user_id IS NOT NULL THEN
+        UPDATE users SET
+            total_tracks = total_tracks - 1,
+            total_streams = total_streams - COALESCE(OLD.streams, 0),
+            total_revenue = total_revenue - COALESCE(OLD.revenue, 0)
+        WHERE id = OLD.user_id;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.user_id IS NOT NULL THEN
+        UPDATE users SET
+            total_tracks = total_tracks + 1,
+            total_streams = total_streams + COALESCE(NEW.streams, 0),
+            total_revenue = total_revenue + COALESCE(NEW.revenue, 0)
+        WHERE id = NEW.user_id;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tracks_user_counters ON tracks;
+CREATE TRIGGER trg_tracks_user_counters
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, streams, revenue ON tracks
+    FOR EACH ROW EXECUTE FUNCTION tracks_user_counters_trigger();
+
+-- Detect counter drift against tracks and, unless apply_fix is false, correct it.
+-- Track writes are blocked for the duration so the comparison is exact.
+CREATE OR REPLACE FUNCTION reconcile_user_track_counters(apply_fix BOOLEAN DEFAULT TRUE)
+RETURNS TABLE (
+    user_id INTEGER,
+    stored_tracks INTEGER, actual_tracks INTEGER,
+    stored_streams BIGINT, actual_streams BIGINT,
+    stored_revenue DECIMAL, actual_revenue DECIMAL
+)
+LANGUAGE sql
+AS $$
+    LOCK TABLE tracks IN SHARE MODE;
+    
+    WITH actual AS (
+        SELECT u.id,
+               COUNT(t.id)::INTEGER AS tracks,
+               COALESCE(SUM(t.streams), 0)::BIGINT AS streams,
+               COALESCE(SUM(t.revenue), 0) AS revenue
+        FROM users u
+        LEFT JOIN tracks t ON t.user_id = u.id
+        GROUP BY u.id
+    ),
+    drift AS (
+        SELECT u.id AS user_id,
+               u.total_tracks AS stored_tracks, a.tracks AS actual_tracks,
+               u.total_streams AS stored_streams, a.streams AS actual_streams,
+               u.total_revenue AS stored_revenue, a.revenue AS actual_revenue
+        FROM users u
+        JOIN actual a ON a.id = u.id
+        WHERE (u.total_tracks, u.total_streams, u.total_revenue) IS DISTINCT FROM (a.tracks, a.streams, a.revenue)
+    ),
+    fixed AS (
+        UPDATE users u SET
+            total_tracks = d.actual_tracks,
+            total_streams = d.actual_streams,
+            total_revenue = d.actual_revenue
+        FROM drift d
+        WHERE apply_fix AND u.id = d.user_id
+    )
+    SELECT user_id, stored_tracks, actual_tracks, stored_streams, actual_streams, stored_revenue, actual_revenue
+    FROM drift
+    ORDER BY user_id;
+$$;
+
+SELECT COUNT(*) FROM reconcile_user_track_counters(TRUE);
+
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at);
+CREATE INDEX IF NOT EXISTS idx_users_role_created_at ON users(role, created_at);
@@ -0,0 +1,12 @@
+-- Leases on pending tracks so moderators and automated checkers never work the same track
+CREATE TABLE IF NOT EXISTS moderation_claims (
+    track_id INTEGER PRIMARY KEY REFERENCES tracks(id),
+    moderator_id INTEGER NOT NULL REFERENCES users(id),
+    claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_moderation_claims_moderator ON moderation_claims(moderator_id, expires_at);
+
+-- Queue head: oldest pending uploads first
+CREATE INDEX IF NOT EXISTS idx_tracks_pending_queue ON tracks(upload_date, id) WHERE status = 'pending';
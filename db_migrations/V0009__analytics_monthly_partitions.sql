@@ -0,0 +1,110 @@
+-- Range-partition analytics by month so date filters prune partitions and retention is a detach
+
+-- Create monthly partitions covering [first_day, last_day]; returns how many were created
+CREATE OR REPLACE FUNCTION ensure_analytics_partitions(first_day DATE, last_day DATE) RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', first_day)::DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE month_start <= last_day LOOP
+        partition_name := 'analytics_y' || to_char(month_start, 'YYYY') || 'm' || to_char(month_start, 'MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtext('ensure_analytics_partitions'));
+            IF to_regclass(partition_name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF analytics FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+                );
+                created := created + 1;
+            END IF;
+        END IF;
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+-- Detach (not delete) every monthly partition that ends on or before before_day and keep it
+-- as analytics_archive_yYYYYmMM. Rollups keep their history: detaching fires no DELETE triggers.
+CREATE OR REPLACE FUNCTION detach_analytics_partitions(before_day DATE) RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'analytics'::regclass
+          AND c.relname ~ '^analytics_y\d{4}m\d{2}$'
+          AND (to_date(substr(c.relname, 12), 'YYYY"m"MM') + INTERVAL '1 month')::DATE <= before_day
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE analytics DETACH PARTITION %I', partition_name);
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', partition_name, replace(partition_name, 'analytics_', 'analytics_archive_'));
+        RETURN NEXT replace(partition_name, 'analytics_', 'analytics_archive_');
+    END LOOP;
+END;
+$$;
+
+-- Move the existing table aside, freeing its names for the partitioned one
+ALTER TABLE analytics RENAME TO analytics_legacy;
+ALTER TABLE analytics_legacy RENAME CONSTRAINT analytics_pkey TO analytics_legacy_pkey;
+ALTER TABLE analytics_legacy RENAME CONSTRAINT analytics_track_id_date_country_platform_key TO analytics_legacy_track_id_date_country_platform_key;
+ALTER INDEX IF EXISTS idx_analytics_track_id RENAME TO idx_analytics_legacy_track_id;
+ALTER INDEX IF EXISTS idx_analytics_date RENAME TO idx_analytics_legacy_date;
+ALTER SEQUENCE analytics_id_seq OWNED BY NONE;
+
+CREATE TABLE analytics (
+    id INTEGER NOT NULL DEFAULT nextval('analytics_id_seq'),
+    track_id INTEGER REFERENCES tracks(id),
+    date DATE NOT NULL,
+    streams INTEGER DEFAULT 0,
+    revenue DECIMAL(10, 2) DEFAULT 0.00,
+    country VARCHAR(3),
+    platform VARCHAR(50),
+    age_group VARCHAR(20),
+    gender VARCHAR(20),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date),
+    UNIQUE (track_id, date, country, platform)
+) PARTITION BY RANGE (date);
+
+ALTER SEQUENCE analytics_id_seq OWNED BY analytics.id;
+
+SELECT ensure_analytics_partitions(
+    LEAST(COALESCE((SELECT MIN(date) FROM analytics_legacy), CURRENT_DATE), CURRENT_DATE),
+    GREATEST(COALESCE((SELECT MAX(date) FROM analytics_legacy), CURRENT_DATE), (CURRENT_DATE + INTERVAL '3 months')::DATE)
+);
+
+-- Rows are copied before the rollup/version triggers exist: the rollups already count them
+INSERT INTO analytics (id, track_id, date, streams, revenue, country, platform, age_group, gender, created_at)
+SELECT id, track_id, date, streams, revenue, country, platform, age_group, gender, created_at
+FROM analytics_legacy;
+
+DROP TABLE analytics_legacy;
+
+CREATE INDEX IF NOT EXISTS idx_analytics_date ON analytics(date);
+
+CREATE TRIGGER trg_analytics_rollup_insert
+    AFTER INSERT ON analytics
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_trigger();
+
+CREATE TRIGGER trg_analytics_rollup_update
+    AFTER UPDATE ON analytics
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_trigger();
+
+CREATE TRIGGER trg_analytics_rollup_delete
+    AFTER DELETE ON analytics
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION analytics_rollup_trigger();
+
+CREATE TRIGGER trg_analytics_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON analytics
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
@@ -0,0 +1,99 @@
+-- One row per (participant, peer) pair: the inbox listing reads this instead of scanning messages
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    peer_id INTEGER NOT NULL REFERENCES users(id),
+    last_message_id INTEGER NOT NULL,
+    last_message_at TIMESTAMP NOT NULL,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, peer_id)
+);
+
+-- Inbox page: range scan in (last_message_at, peer_id) order for one user
+CREATE INDEX IF NOT EXISTS idx_conversations_user_recent ON conversations(user_id, last_message_at DESC, peer_id DESC);
+
+-- Conversation history: both directions of a pair share one key, paged by (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_messages_pair_recent
+    ON messages (LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), created_at DESC, id DESC);
+
+-- Legacy "all my messages" feed: one ordered range scan per direction instead of an OR
+CREATE INDEX IF NOT EXISTS idx_messages_sender_recent ON messages(sender_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_receiver_recent ON messages(receiver_id, created_at DESC, id DESC);
+
+-- Mark-read only touches unread rows
+CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages(receiver_id, sender_id, id) WHERE is_read = false;
+
+CREATE OR REPLACE FUNCTION touch_conversation(owner INTEGER, peer INTEGER, message_id INTEGER, message_at TIMESTAMP, unread_delta INTEGER)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO conversations (user_id, peer_id, last_message_id, last_message_at, unread_count)
+    VALUES (owner, peer, message_id, message_at, GREATEST(unread_delta, 0))
+    ON CONFLICT (user_id, peer_id) DO UPDATE SET
+        last_message_id = GREATEST(conversations.last_message_id, EXCLUDED.last_message_id),
+        last_message_at = GREATEST(conversations.last_message_at, EXCLUDED.last_message_at),
+        unread_count = GREATEST(conversations.unread_count + unread_delta, 0);
+$$;
+
+CREATE OR REPLACE FUNCTION messages_conversation_insert_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.sender_id IS NULL OR NEW.receiver_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    
+    PERFORM touch_conversation(NEW.sender_id, NEW.receiver_id, NEW.id, COALESCE(NEW.created_at, CURRENT_TIMESTAMP), 0);
+    IF NEW.receiver_id <> NEW.sender_id THEN
+        PERFORM touch_conversation(
+            NEW.receiver_id, NEW.sender_id, NEW.id, COALESCE(NEW.created_at, CURRENT_TIMESTAMP),
+            CASE WHEN COALESCE(NEW.is_read, false) THEN 0 ELSE 1 END
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_messages_conversation_insert ON messages;
+CREATE TRIGGER trg_messages_conversation_insert
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_conversation_insert_trigger();
+
+-- Read/unread flips, applied once per statement so a bulk mark-read is one UPDATE per conversation
+CREATE OR REPLACE FUNCTION messages_conversation_read_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE conversations c SET unread_count = GREATEST(c.unread_count + d.delta, 0)
+    FROM (
+        SELECT n.receiver_id, n.sender_id,
+               SUM(CASE WHEN COALESCE(n.is_read, false) THEN -1 ELSE 1 END)::INTEGER AS delta
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE COALESCE(n.is_read, false) <> COALESCE(o.is_read, false)
+          AND n.receiver_id <> n.sender_id
+        GROUP BY n.receiver_id, n.sender_id
+    ) d
+    WHERE c.user_id = d.receiver_id AND c.peer_id = d.sender_id;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_messages_conversation_read ON messages;
+CREATE TRIGGER trg_messages_conversation_read
+    AFTER UPDATE ON messages
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION messages_conversation_read_trigger();
+
+-- Backfill from existing messages
+INSERT INTO conversations (user_id, peer_id, last_message_id, last_message_at, unread_count)
+SELECT side.user_id, side.peer_id,
+       MAX(m.id),
+       MAX(COALESCE(m.created_at, CURRENT_TIMESTAMP)),
+       COUNT(*) FILTER (WHERE side.user_id = m.receiver_id AND m.sender_id <> m.receiver_id AND NOT COALESCE(m.is_read, false))
+FROM messages m
+CROSS JOIN LATERAL (
+    VALUES (m.sender_id, m.receiver_id), (m.receiver_id, m.sender_id)
+) AS side(user_id, peer_id)
+WHERE m.sender_id IS NOT NULL AND m.receiver_id IS NOT NULL
+GROUP BY side.user_id, side.peer_id
+ON CONFLICT (user_id, peer_id) DO NOTHING;
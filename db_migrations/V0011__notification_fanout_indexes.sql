@@ -0,0 +1,5 @@
+-- Unread notifications per user: serves the unread count as an index-only scan and the mark-all-read range
+CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user_id, id) WHERE is_read = false;
+
+-- Notification feed page, newest first
+CREATE INDEX IF NOT EXISTS idx_notifications_user_recent ON notifications(user_id, created_at DESC);
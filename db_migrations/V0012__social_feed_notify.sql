@@ -0,0 +1,32 @@
+-- Wake long-polling feed readers: one NOTIFY per affected user per statement, delivered on commit
+CREATE OR REPLACE FUNCTION notify_social_feed() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'messages' THEN
+        PERFORM pg_notify('social_user_' || r.user_id, TG_TABLE_NAME)
+        FROM (
+            SELECT receiver_id AS user_id FROM new_rows
+            UNION
+            SELECT sender_id FROM new_rows
+        ) r
+        WHERE r.user_id IS NOT NULL;
+    ELSE
+        PERFORM pg_notify('social_user_' || r.user_id, TG_TABLE_NAME)
+        FROM (SELECT DISTINCT user_id FROM new_rows WHERE user_id IS NOT NULL) r;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_messages_feed_notify ON messages;
+CREATE TRIGGER trg_messages_feed_notify
+    AFTER INSERT ON messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_social_feed();
+
+DROP TRIGGER IF EXISTS trg_notifications_feed_notify ON notifications;
+CREATE TRIGGER trg_notifications_feed_notify
+    AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_social_feed();
@@ -0,0 +1,13 @@
+-- playlist_tracks.position becomes a sparse rank: consecutive tracks are PLAYLIST_RANK_GAP apart,
+-- so a move or insert takes a value between its neighbours and rewrites only its own row
+ALTER TABLE playlist_tracks ALTER COLUMN position TYPE BIGINT;
+
+UPDATE playlist_tracks pt SET position = r.rn * 65536
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY playlist_id ORDER BY position, id) AS rn
+    FROM playlist_tracks
+) r
+WHERE pt.id = r.id;
+
+-- Contents page in playlist order, and neighbour lookups for moves
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_order ON playlist_tracks(playlist_id, position, id);
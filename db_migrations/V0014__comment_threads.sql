@@ -0,0 +1,39 @@
+-- Direct reply count kept on each comment so threaded pages never count children
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS reply_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE comments c SET reply_count = r.replies
+FROM (
+    SELECT parent_id, COUNT(*) AS replies
+    FROM comments
+    WHERE parent_id IS NOT NULL
+    GROUP BY parent_id
+) r
+WHERE c.id = r.parent_id;
+
+CREATE OR REPLACE FUNCTION comments_reply_count_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.parent_id IS NOT DISTINCT FROM NEW.parent_id THEN
+        RETURN NULL;
+    END IF;
+    
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.parent_id IS NOT NULL THEN
+        UPDATE comments SET reply_count = GREATEST(reply_count - 1, 0) WHERE id = OLD.parent_id;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.parent_id IS NOT NULL THEN
+        UPDATE comments SET reply_count = reply_count + 1 WHERE id = NEW.parent_id;
+    END IF;
+    
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_comments_reply_count ON comments;
+CREATE TRIGGER trg_comments_reply_count
+    AFTER INSERT OR DELETE OR UPDATE OF parent_id ON comments
+    FOR EACH ROW EXECUTE FUNCTION comments_reply_count_trigger();
+
+-- Top-level page (parent_id IS NULL) and reply pages of one parent are both range scans
+CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments(track_id, parent_id, created_at, id);
@@ -0,0 +1,2 @@
+-- Due-release scan for the publisher: status = 'scheduled' AND release_date <= today, oldest first
+CREATE INDEX IF NOT EXISTS idx_releases_status_date ON releases(status, release_date, id);
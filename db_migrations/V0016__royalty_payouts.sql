@@ -0,0 +1,49 @@
+-- Revenue split rules: the label's share of an artist's net revenue.
+-- A row with user_id NULL is the label default; a row with user_id overrides it for that artist.
+CREATE TABLE IF NOT EXISTS royalty_split_rules (
+    id SERIAL PRIMARY KEY,
+    label_id INTEGER NOT NULL REFERENCES labels(id),
+    user_id INTEGER REFERENCES users(id),
+    label_share DECIMAL(6, 5) NOT NULL CHECK (label_share >= 0 AND label_share <= 1),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_royalty_split_rules_label_user
+    ON royalty_split_rules(label_id, COALESCE(user_id, 0));
+
+-- One line per payee per source artist per period; recomputing a period replaces its lines
+CREATE TABLE IF NOT EXISTS payout_statements (
+    period_start DATE NOT NULL,
+    period_end DATE NOT NULL,
+    payee_type VARCHAR(10) NOT NULL CHECK (payee_type IN ('user', 'label')),
+    payee_id INTEGER NOT NULL,
+    source_user_id INTEGER NOT NULL REFERENCES users(id),
+    label_id INTEGER REFERENCES labels(id),
+    streams BIGINT NOT NULL DEFAULT 0,
+    gross_revenue DECIMAL(14, 2) NOT NULL,
+    platform_fee DECIMAL(14, 2) NOT NULL,
+    share DECIMAL(6, 5) NOT NULL,
+    amount DECIMAL(14, 2) NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period_start, period_end, payee_type, payee_id, source_user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_payout_statements_payee ON payout_statements(payee_type, payee_id, period_start);
+
+-- ETags for rule and statement reads
+DO $$
+DECLARE
+    versioned_table TEXT;
+BEGIN
+    FOREACH versioned_table IN ARRAY ARRAY['royalty_split_rules', 'payout_statements'] LOOP
+        INSERT INTO table_versions (table_name) VALUES (versioned_table) ON CONFLICT DO NOTHING;
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%s_version ON %I', versioned_table, versioned_table);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%s_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I
+             FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+            versioned_table, versioned_table
+        );
+    END LOOP;
+END;
+$$;
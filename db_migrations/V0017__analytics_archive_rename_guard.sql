@@ -0,0 +1,33 @@
+-- Detaching a month whose archive name is already taken (a partition re-created and detached
+-- again after an earlier archive) used to fail on the rename. Keep both: the later one gets
+-- the first free analytics_archive_yYYYYmMM_N suffix.
+CREATE OR REPLACE FUNCTION detach_analytics_partitions(before_day DATE) RETURNS SETOF TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    partition_name TEXT;
+    archive_name TEXT;
+    suffix INTEGER;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'analytics'::regclass
+          AND c.relname ~ '^analytics_y\d{4}m\d{2}$'
+          AND (to_date(substr(c.relname, 12), 'YYYY"m"MM') + INTERVAL '1 month')::DATE <= before_day
+        ORDER BY c.relname
+    LOOP
+        archive_name := replace(partition_name, 'analytics_', 'analytics_archive_');
+        suffix := 1;
+        WHILE to_regclass(archive_name) IS NOT NULL LOOP
+            suffix := suffix + 1;
+            archive_name := replace(partition_name, 'analytics_', 'analytics_archive_') || '_' || suffix;
+        END LOOP;
+        
+        EXECUTE format('ALTER TABLE analytics DETACH PARTITION %I', partition_name);
+        EXECUTE format('ALTER TABLE %I RENAME TO %I', partition_name, archive_name);
+        RETURN NEXT archive_name;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,26 @@
+-- Each message upserts two conversation rows. Touching them sender-first meant A->B and B->A
+-- sent concurrently locked (A,B)/(B,A) in opposite orders and deadlocked. Always take the row
+-- owned by the lower user id first, so opposite-direction sends queue on the same row instead.
+CREATE OR REPLACE FUNCTION messages_conversation_insert_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    message_at TIMESTAMP := COALESCE(NEW.created_at, CURRENT_TIMESTAMP);
+    receiver_delta INTEGER := CASE WHEN COALESCE(NEW.is_read, false) THEN 0 ELSE 1 END;
+BEGIN
+    IF NEW.sender_id IS NULL OR NEW.receiver_id IS NULL THEN
+        RETURN NULL;
+    END IF;
+    
+    IF NEW.receiver_id = NEW.sender_id THEN
+        PERFORM touch_conversation(NEW.sender_id, NEW.receiver_id, NEW.id, message_at, 0);
+    ELSIF NEW.sender_id < NEW.receiver_id THEN
+        PERFORM touch_conversation(NEW.sender_id, NEW.receiver_id, NEW.id, message_at, 0);
+        PERFORM touch_conversation(NEW.receiver_id, NEW.sender_id, NEW.id, message_at, receiver_delta);
+    ELSE
+        PERFORM touch_conversation(NEW.receiver_id, NEW.sender_id, NEW.id, message_at, receiver_delta);
+        PERFORM touch_conversation(NEW.sender_id, NEW.receiver_id, NEW.id, message_at, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$;
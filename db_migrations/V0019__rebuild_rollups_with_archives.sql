@@ -0,0 +1,38 @@
+-- Detached analytics_archive_* partitions still count toward the rollups (detaching fires no
+-- triggers), so a full rebuild must read them too or archived months vanish from the dashboards
+CREATE OR REPLACE FUNCTION rebuild_analytics_rollups() RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    source_sql TEXT := 'SELECT track_id, date, streams, revenue FROM analytics';
+    archive_name TEXT;
+BEGIN
+    LOCK TABLE analytics IN SHARE MODE;
+    
+    FOR archive_name IN
+        SELECT c.relname
+        FROM pg_class c
+        WHERE c.relkind = 'r'
+          AND c.relnamespace = to_regnamespace(current_schema())
+          AND c.relname ~ '^analytics_archive_y\d{4}m\d{2}(_\d+)?$'
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('LOCK TABLE %I IN SHARE MODE', archive_name);
+        source_sql := source_sql || format(' UNION ALL SELECT track_id, date, streams, revenue FROM %I', archive_name);
+    END LOOP;
+    
+    TRUNCATE analytics_daily_track, analytics_daily_user, analytics_daily_platform,
+             analytics_total_track, analytics_total_user;
+    
+    EXECUTE format(
+        'SELECT apply_analytics_rollup_delta(array_agg(track_id), array_agg(date), array_agg(streams), array_agg(revenue))
+         FROM (
+             SELECT track_id, date, SUM(COALESCE(streams, 0))::BIGINT AS streams, SUM(COALESCE(revenue, 0)) AS revenue
+             FROM (%s) facts
+             GROUP BY track_id, date
+         ) d
+         HAVING COUNT(*) > 0',
+        source_sql
+    );
+END;
+$$;
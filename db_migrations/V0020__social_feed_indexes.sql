@@ -0,0 +1,5 @@
+-- Long-poll feed: one (user, id) range scan per direction instead of a global id scan
+-- filtered by user, so an idle user's poll reads only that user's rows past the cursor
+CREATE INDEX IF NOT EXISTS idx_messages_receiver_feed ON messages(receiver_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender_feed ON messages(sender_id, id);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_feed ON notifications(user_id, id);
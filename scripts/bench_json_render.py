@@ -0,0 +1,67 @@
+'''
+Business: Benchmark render=db (Postgres-rendered JSON) against the default json.dumps path of list endpoints
+Args: DATABASE_URL in environment; optional --repeat N
+Returns: Prints timings per endpoint and fails if the two bodies are not byte-identical
+'''
+
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+CASES = [
+    ('api', {}),
+    ('api', {'status': 'published', 'sort_by': 'streams'}),
+    ('users', {}),
+    ('labels', {'resource': 'labels'}),
+    ('labels', {'resource': 'releases'}),
+]
+
+def load_handler(function_name: str):
+    spec = importlib.util.spec_from_file_location(f'{function_name}_index', os.path.join(BACKEND_DIR, function_name, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+def time_handler(handler, params: Dict[str, Any], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            raise RuntimeError(response['body'])
+    return timings
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    handlers = {name: load_handler(name) for name in {name for name, _ in CASES}}
+    mismatches = 0
+    
+    for name, params in CASES:
+        handler = handlers[name]
+        db_params = dict(params, render='db')
+        
+        python_body = handler({'httpMethod': 'GET', 'queryStringParameters': params}, None)['body']
+        db_body = handler({'httpMethod': 'GET', 'queryStringParameters': db_params}, None)['body']
+        identical = python_body == db_body
+        mismatches += not identical
+        
+        python_ms = statistics.median(time_handler(handler, params, args.repeat))
+        db_ms = statistics.median(time_handler(handler, db_params, args.repeat))
+        print(f"{name:<7} {str(params):<50} bytes={len(python_body):>10} "
+              f"python={python_ms:8.2f}ms db={db_ms:8.2f}ms speedup={python_ms / db_ms:5.2f}x "
+              f"{'identical' if identical else 'MISMATCH'}")
+    
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())